@@ -0,0 +1,178 @@
+import os
+import pandas as pd
+
+# Every query behaves like the fact table (purchase_lines ⋈ product ⋈ purchase_header), so both
+# backends return the same numbers
+DUCKDB_TABLES = {
+    'product': "read_parquet('{root}/product/*.parquet')",
+    'purchase_header': "read_parquet('{root}/purchase_header/*/*.parquet', hive_partitioning = true)",
+    'purchase_lines': "read_parquet('{root}/purchase_lines/*/*.parquet', hive_partitioning = true)"
+}
+
+DUCKDB_QUERIES = {
+    'product_totals': """
+        SELECT l.PRODUCT_ID, COUNT(*) AS LINE_COUNT, SUM(l.QUANTITY) AS QUANTITY
+        FROM purchase_lines l JOIN product p USING (PRODUCT_ID)
+        GROUP BY l.PRODUCT_ID""",
+    # Lines are partitioned by their purchase's date, so PURCHASE_DATE needs no header join
+    'daily': """
+        WITH lines AS (
+            SELECT l.PURCHASE_DATE, SUM(l.QUANTITY) AS QUANTITY, COUNT(*) AS LINE_COUNT
+            FROM purchase_lines l JOIN product p USING (PRODUCT_ID)
+            GROUP BY l.PURCHASE_DATE
+        ), purchases AS (
+            SELECT PURCHASE_DATE, COUNT(*) AS PURCHASE_COUNT FROM purchase_header GROUP BY PURCHASE_DATE
+        )
+        SELECT COALESCE(l.PURCHASE_DATE, h.PURCHASE_DATE) AS PURCHASE_DATE, COALESCE(l.QUANTITY, 0) AS QUANTITY,
+            COALESCE(l.LINE_COUNT, 0) AS LINE_COUNT, COALESCE(h.PURCHASE_COUNT, 0) AS PURCHASE_COUNT
+        FROM lines l FULL OUTER JOIN purchases h USING (PURCHASE_DATE)
+        ORDER BY PURCHASE_DATE""",
+    'department_daily': """
+        SELECT p.DEPARTMENT_NAME, l.PURCHASE_DATE, SUM(l.QUANTITY) AS QUANTITY, COUNT(*) AS LINE_COUNT
+        FROM purchase_lines l JOIN product p USING (PRODUCT_ID)
+        GROUP BY p.DEPARTMENT_NAME, l.PURCHASE_DATE
+        ORDER BY p.DEPARTMENT_NAME, l.PURCHASE_DATE""",
+    # Products bought most/least often in each hour, ties included
+    'hourly_extremes': """
+        WITH counts AS (
+            SELECT hour(CAST(h.PURCHASE_DATE_TIME AS TIMESTAMP)) AS PURCHASE_HOUR, l.PRODUCT_ID, COUNT(*) AS COUNT
+            FROM purchase_lines l JOIN product p USING (PRODUCT_ID) JOIN purchase_header h USING (PURCHASE_ID)
+            GROUP BY ALL
+        )
+        SELECT *, COUNT = max(COUNT) OVER (PARTITION BY PURCHASE_HOUR) AS IS_MAX,
+            COUNT = min(COUNT) OVER (PARTITION BY PURCHASE_HOUR) AS IS_MIN
+        FROM counts
+        QUALIFY IS_MAX OR IS_MIN
+        ORDER BY PURCHASE_HOUR, PRODUCT_ID""",
+    'purchases_by_hour': """
+        SELECT hour(CAST(PURCHASE_DATE_TIME AS TIMESTAMP)) AS PURCHASE_HOUR, COUNT(*) AS PURCHASE_COUNT
+        FROM purchase_header GROUP BY PURCHASE_HOUR ORDER BY PURCHASE_HOUR"""
+}
+
+# Per-department count and mean/min/max/std of each product dimension, with display column names
+def department_summary(product_df):
+    stats = ['mean', 'min', 'max', 'std']
+    columns = ['HEIGHT_INCHES', 'WIDTH_INCHES', 'DEPTH_INCHES', 'WEIGHT_GRAMS', 'VOLUME']
+
+    agg_dict = {col: stats for col in columns}
+    agg_dict['PRODUCT_ID'] = 'count'
+    summary = product_df.groupby('DEPARTMENT_NAME', observed=True).agg(agg_dict).reset_index()
+    summary.columns = ['_'.join(col).strip() if col[1] else col[0] for col in summary.columns.values]
+    rename_dict = {f'{col}_{stat}': f'{stat.capitalize()} {col.split("_")[0].capitalize()}' for col in columns for stat in stats}
+    rename_dict['PRODUCT_ID_count'] = 'Count'
+    summary.rename(columns=rename_dict, inplace=True)
+
+    cols = ['DEPARTMENT_NAME', 'Count'] + [col for col in summary.columns if col not in ['DEPARTMENT_NAME', 'Count']]
+    return summary[cols]
+
+class AnalyticsEngine:
+    # Answers the analysis page's queries and hands back small result frames. 'pandas' reads the
+    # materialized rollups; 'duckdb' runs lazy, multi-threaded SQL directly over the parquet
+    # dataset, so the history never has to fit in memory. 'auto' uses duckdb when installed.
+    # With statistics='sketch' the top products and each hour's most bought products come from
+    # the persisted popularity sketches instead, in time independent of the history's size;
+    # 'exact' answers them from the rollups (or SQL) as well, e.g. to validate the sketches.
+    def __init__(self, data_processor, backend='auto', statistics='sketch'):
+        if statistics not in ('sketch', 'exact'):
+            raise ValueError(f"Unknown analytics statistics: {statistics}")
+        self.data_processor = data_processor
+        self.statistics = statistics
+        self.connection = None
+        if backend in ('auto', 'duckdb'):
+            try:
+                import duckdb
+            except ImportError:
+                if backend == 'duckdb':
+                    raise
+                backend = 'pandas'
+            else:
+                backend = 'duckdb'
+                self.connection = duckdb.connect()
+                root = os.path.abspath(os.path.join(data_processor.base_path, 'partitions')).replace("'", "''")
+                for name, source in DUCKDB_TABLES.items():
+                    self.connection.execute(f"CREATE VIEW {name} AS SELECT * FROM {source.format(root=root)}")
+        elif backend != 'pandas':
+            raise ValueError(f"Unknown analytics backend: {backend}")
+        self.backend = backend
+
+    # Backend from the ANALYTICS_BACKEND environment variable (default 'pandas'), statistics
+    # from ANALYTICS_STATISTICS (default 'sketch')
+    @classmethod
+    def from_processor(cls, data_processor):
+        return cls(data_processor, os.environ.get('ANALYTICS_BACKEND', 'pandas'), os.environ.get('ANALYTICS_STATISTICS', 'sketch'))
+
+    # Each query runs on its own cursor so concurrent sessions can share one engine
+    def sql(self, name):
+        return self.connection.cursor().execute(DUCKDB_QUERIES[name]).df()
+
+    # PRODUCT_ID, LINE_COUNT, QUANTITY over the whole history
+    def product_totals(self):
+        if self.backend == 'duckdb':
+            return self.sql('product_totals')
+        return self.data_processor.get_df('product_daily').groupby('PRODUCT_ID')[['LINE_COUNT', 'QUANTITY']].sum().reset_index()
+
+    # Popularity sketches of the current data, loaded once per data version
+    def popularity(self):
+        return self.data_processor.get_resource('popularity', lambda data_processor: data_processor.load_popularity())
+
+    # PRODUCT_ID, LINE_COUNT, QUANTITY of the k products bought on the most lines
+    def top_products(self, k=10):
+        if self.statistics == 'sketch':
+            return self.popularity().top('all', k=k)[['PRODUCT_ID', 'LINE_COUNT', 'QUANTITY']].astype({'LINE_COUNT': 'int64'})
+        totals = self.product_totals().sort_values(['LINE_COUNT', 'PRODUCT_ID'], ascending=[False, True])
+        return totals.head(k).reset_index(drop=True)
+
+    # PURCHASE_DATE, QUANTITY, LINE_COUNT, PURCHASE_COUNT per day
+    def daily(self):
+        if self.backend == 'duckdb':
+            return self.sql('daily')
+        return self.data_processor.get_df('daily')
+
+    # DEPARTMENT_NAME, PURCHASE_DATE, QUANTITY, LINE_COUNT per department and day
+    def department_daily(self):
+        if self.backend == 'duckdb':
+            return self.sql('department_daily')
+        return self.data_processor.get_df('department_daily')
+
+    # (most bought, least bought) products of each hour as PURCHASE_HOUR, PRODUCT_ID, COUNT.
+    # Sketches only track the most bought products, so the least bought are always exact.
+    def hourly_extremes(self):
+        if self.statistics == 'sketch':
+            return self.popularity().hourly_top(), self.hourly_least_bought()
+        if self.backend == 'duckdb':
+            extremes = self.sql('hourly_extremes')
+            columns = ['PURCHASE_HOUR', 'PRODUCT_ID', 'COUNT']
+            most = extremes.loc[extremes['IS_MAX'], columns]
+            least = extremes.loc[extremes['IS_MIN'], columns]
+            return most.reset_index(drop=True), least.reset_index(drop=True)
+
+        hourly = self.data_processor.get_df('hourly').rename(columns={'LINE_COUNT': 'COUNT'})
+        by_hour = hourly.groupby('PURCHASE_HOUR')['COUNT']
+        most = hourly[by_hour.transform('max') == hourly['COUNT']]
+        least = hourly[by_hour.transform('min') == hourly['COUNT']]
+        return most.reset_index(drop=True), least.reset_index(drop=True)
+
+    def hourly_least_bought(self):
+        if self.backend == 'duckdb':
+            extremes = self.sql('hourly_extremes')
+            return extremes.loc[extremes['IS_MIN'], ['PURCHASE_HOUR', 'PRODUCT_ID', 'COUNT']].reset_index(drop=True)
+        hourly = self.data_processor.get_df('hourly').rename(columns={'LINE_COUNT': 'COUNT'})
+        return hourly[hourly.groupby('PURCHASE_HOUR')['COUNT'].transform('min') == hourly['COUNT']].reset_index(drop=True)
+
+    # Number of purchases per hour of the day, indexed by hour
+    def purchases_by_hour(self):
+        if self.backend == 'duckdb':
+            return self.sql('purchases_by_hour').set_index('PURCHASE_HOUR')['PURCHASE_COUNT']
+        # Only the timestamp column is read from disk
+        purchase_times = self.data_processor.scan('purchase_header', columns=['PURCHASE_DATE_TIME'])
+        return purchase_times['PURCHASE_DATE_TIME'].dt.hour.value_counts().sort_index()
+
+    # Missing values per column of a source table
+    def missing_values(self, table):
+        if self.backend == 'duckdb':
+            # PURCHASE_DATE is the partition key, not a stored column
+            columns = self.connection.cursor().execute(f"DESCRIBE SELECT * FROM {table}").df()['column_name']
+            columns = [column for column in columns if column != 'PURCHASE_DATE']
+            counts = ', '.join(f'COUNT(*) - COUNT("{column}")' for column in columns)
+            return pd.Series(self.connection.cursor().execute(f"SELECT {counts} FROM {table}").fetchone(), index=columns)
+        return self.data_processor.get_df(table).isnull().sum()
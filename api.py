@@ -0,0 +1,205 @@
+import os
+import json
+import functools
+import contextlib
+import anyio
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from data_processor import DataProcessor
+from queries import PurchaseQueries
+from forecasting import BatchForecaster, daily_purchase_counts
+from model_registry import ModelRegistry, data_fingerprint
+from forecast_store import ForecastStore
+from predictors import Predictor
+import instrumentation
+
+# Headless JSON API over the same lookup and forecasting classes as the Streamlit app.
+#   uvicorn api:app --workers 4
+# Every worker process loads the data, indexes and trained models once at startup. Handlers run
+# in a bounded thread pool (API_THREADS, default 8), so load beyond that queues instead of
+# spawning more threads.
+
+STATE = {}
+MAX_IDS = 10000
+
+def load_state(data_dir=None, model_dir=None):
+    data_processor = DataProcessor(data_dir or os.environ.get('DATA_DIR', 'data'))
+    registry = ModelRegistry(model_dir or os.environ.get('MODEL_DIR', 'models'))
+    models = {model_name: registry.load(model_name) for model_name in registry.available_models()}
+    forecast_data = daily_purchase_counts(data_processor)
+    STATE.update(
+        data_processor=data_processor,
+        queries=PurchaseQueries.from_processor(data_processor),
+        models=models,
+        predictors={model_name: Predictor.for_model(model, registry.describe(model_name).get('features'))
+            for model_name, model in models.items()},
+        forecast_data=forecast_data,
+        data_version=data_fingerprint(forecast_data),
+        forecast_store=ForecastStore(registry.model_dir),
+        model_hashes={model_name: registry.describe(model_name)['sha256'] for model_name in models}
+    )
+    # Index the precomputed forecasts now rather than in the first request
+    STATE['forecast_store'].index()
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    STATE['limiter'] = anyio.CapacityLimiter(int(os.environ.get('API_THREADS', 8)))
+    if 'queries' not in STATE:
+        await anyio.to_thread.run_sync(load_state)
+    yield
+
+# Runs a blocking lookup on the bounded worker pool, as its own instrumentation run
+def instrumented_call(func, *args):
+    instrumentation.start_run('api')
+    return func(*args)
+
+async def run(func, *args):
+    return await anyio.to_thread.run_sync(functools.partial(instrumented_call, func, *args), limiter=STATE['limiter'])
+
+def records(df):
+    return json.loads(df.to_json(orient='records', date_format='iso'))
+
+def query_param(request, name, parse=str, default=None):
+    value = request.query_params.get(name)
+    if value is None:
+        if default is None:
+            raise HTTPException(400, f"Missing query parameter: {name}")
+        return default
+    try:
+        return parse(value)
+    except ValueError:
+        raise HTTPException(400, f"Invalid value for {name}: {value}")
+
+# Distinct IDs of a JSON list, in request order (like PurchaseQueries.parse_ids)
+def id_list(values, name):
+    # A string is iterable too, and would be read one digit at a time
+    if not isinstance(values, list):
+        raise TypeError(f"{name} must be a list")
+    return list(dict.fromkeys(int(str(i).replace(',', '')) for i in values))
+
+async def json_ids(request):
+    try:
+        body = await request.json()
+        ids = id_list(body['ids'], 'ids')
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(400, 'Expected a JSON body like {"ids": [1, 2, 3]}')
+    if len(ids) > MAX_IDS:
+        raise HTTPException(400, f"At most {MAX_IDS} IDs per request")
+    return ids
+
+async def health(request):
+    return JSONResponse({'status': 'ok', 'models': sorted(STATE['models'])})
+
+async def purchase(request):
+    purchase_id = request.path_params['purchase_id']
+    try:
+        purchase_date, lines = await run(STATE['queries'].purchase, purchase_id)
+    except IndexError:
+        raise HTTPException(404, f"Purchase {purchase_id} not found")
+    return JSONResponse({'purchase_id': purchase_id, 'purchase_date_time': purchase_date.isoformat(), 'lines': records(lines)})
+
+async def purchases_by_date(request):
+    selected_date = query_param(request, 'date', lambda value: pd.Timestamp(value).date())
+    header, lines = await run(STATE['queries'].purchases_on, selected_date)
+    lines = await run(STATE['queries'].merge_product_details, lines)
+    return JSONResponse({'date': selected_date.isoformat(), 'purchases': len(header), 'lines': records(lines)})
+
+async def bulk_purchases(request):
+    result, missing = await run(STATE['queries'].bulk_purchase_lookup, await json_ids(request))
+    return JSONResponse({'rows': records(result), 'missing': missing})
+
+async def product(request):
+    product_id = request.path_params['product_id']
+    details = await run(STATE['queries'].product, product_id)
+    if details.empty:
+        raise HTTPException(404, f"Product {product_id} not found")
+    purchases = await run(STATE['queries'].product_purchases, product_id)
+    return JSONResponse({'product': records(details), 'purchases': records(purchases)})
+
+async def bulk_products(request):
+    result, missing = await run(STATE['queries'].bulk_product_lookup, await json_ids(request))
+    return JSONResponse({'rows': records(result), 'missing': missing})
+
+async def co_purchases(request):
+    product_id = request.path_params['product_id']
+    k = query_param(request, 'k', int, 5)
+    by = query_param(request, 'by', str.upper, 'CO_PURCHASE_COUNT')
+    if by not in ('CO_PURCHASE_COUNT', 'CONFIDENCE', 'LIFT', 'JACCARD'):
+        raise HTTPException(400, f"Invalid value for by: {by}")
+    return JSONResponse({'product_id': product_id, 'co_purchases': records(await run(STATE['queries'].top_co_purchases, product_id, k, by))})
+
+# {"product_ids": [...], "models": [...] (default: all), "start": "2020-05-01", "end": "2020-12-01"}
+async def forecast(request):
+    try:
+        body = await request.json()
+        product_ids = id_list(body['product_ids'], 'product_ids')
+        start_date, end_date = pd.Timestamp(body['start']), pd.Timestamp(body['end'])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(400, 'Expected a JSON body with product_ids, start and end')
+    model_names = body.get('models') or sorted(STATE['models'])
+    if not isinstance(model_names, list) or not all(isinstance(model_name, str) for model_name in model_names):
+        raise HTTPException(400, 'Expected models to be a list of model names')
+    unknown = set(model_names) - set(STATE['models'])
+    if unknown:
+        raise HTTPException(404, f"Unknown models: {', '.join(sorted(unknown))}")
+    if len(product_ids) > MAX_IDS:
+        raise HTTPException(400, f"At most {MAX_IDS} products per request")
+
+    # Unknown products would be forecast from an empty history; they're reported instead
+    known = STATE['queries'].known_products(product_ids)
+    missing = [product_id for product_id, is_known in zip(product_ids, known) if not is_known]
+    product_ids = [product_id for product_id, is_known in zip(product_ids, known) if is_known]
+    if not product_ids:
+        return JSONResponse({'forecast': [], 'missing': missing})
+
+    # Served from the precomputed forecast table when it covers the request
+    result = STATE['forecast_store'].lookup_many(model_names, product_ids, start_date, end_date, STATE['model_hashes'], STATE['data_version'])
+    if result is None:
+        forecaster = BatchForecaster({model_name: STATE['predictors'][model_name] for model_name in model_names})
+        result = await run(forecaster.forecast, STATE['forecast_data'], product_ids, start_date, end_date)
+    return JSONResponse({'forecast': records(result), 'missing': missing})
+
+# {"model": "XGBoost", "rows": [{"day_of_week": 2, "month": 4, ...}, ...]}; a row may also be an
+# array of values in the model's feature order
+async def predict(request):
+    try:
+        body = await request.json()
+        model_name, rows = body['model'], list(body['rows'])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(400, 'Expected a JSON body like {"model": "XGBoost", "rows": [...]}')
+    predictor = STATE['predictors'].get(model_name)
+    if predictor is None:
+        raise HTTPException(404, f"Unknown model: {model_name}")
+    if len(rows) > MAX_IDS:
+        raise HTTPException(400, f"At most {MAX_IDS} rows per request")
+
+    try:
+        X = np.concatenate([predictor.row(row) for row in rows]) if rows else np.empty((0, len(predictor.features)), dtype=np.float32)
+        # A single row takes well under a millisecond, less than the hop to the worker pool
+        predictions = predictor.predict(X) if len(X) <= 1 else await run(predictor.predict, X)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(400, str(e))
+    return JSONResponse({'model': model_name, 'features': predictor.features, 'predictions': predictions.tolist()})
+
+async def http_error(request, exc):
+    return JSONResponse({'error': exc.detail}, status_code=exc.status_code)
+
+app = Starlette(
+    routes=[
+        Route('/health', health),
+        Route('/purchases', purchases_by_date),
+        Route('/purchases/lookup', bulk_purchases, methods=['POST']),
+        Route('/purchases/{purchase_id:int}', purchase),
+        Route('/products/lookup', bulk_products, methods=['POST']),
+        Route('/products/{product_id:int}', product),
+        Route('/products/{product_id:int}/co-purchases', co_purchases),
+        Route('/forecast', forecast, methods=['POST']),
+        Route('/predict', predict, methods=['POST'])
+    ],
+    exception_handlers={HTTPException: http_error},
+    lifespan=lifespan
+)
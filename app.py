@@ -1,53 +1,70 @@
+import time
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-import os
-import joblib
 import plotly.express as px
 from datetime import datetime
 from data_processor import DataProcessor
 from home_page import HomePage
 from data_analysis_page import DataPlots
 from query_tool import QueryTool
+from co_purchase import CoPurchaseEngine
+from analytics import AnalyticsEngine
 from model_page import ModelTrainer
 from conclusion_page import ConclusionPage
+import instrumentation
+import warmup
 
-# Globally load data
-data_processor = DataProcessor()
-product_df = data_processor.get_df('product')
-purchase_header_df = data_processor.get_df('purchase_header')
-purchase_lines_df = data_processor.get_df('purchase_lines')
+# Every rerun is one instrumented run; memory is traced when the process sets DIAGNOSTICS_MEMORY=1
+instrumentation.start_run('streamlit')
 
-# Load trained models
-def load_model(model_name):
-    model_path = os.path.join('models', f'{model_name}.pkl')
-    selected_model = joblib.load(model_path)
-    return selected_model
+# Caches are built in the background once per process while Home already serves
+warmup.start()
+
+# Data is loaded by the pages that use it, so Home never waits for it
+def load_data():
+    with instrumentation.stage('load data'):
+        return DataProcessor()
 
 def home():
     HomePage.load_project_intro()
 
 def data_anlysis():
-    data_plots = DataPlots(data_processor, product_df, purchase_lines_df, purchase_header_df)
+    data_processor = load_data()
+    product_df = data_processor.get_df('product')
+    purchase_header_df = data_processor.get_df('purchase_header')
+    purchase_lines_df = data_processor.get_df('purchase_lines')
+    analytics = data_processor.get_resource('analytics', AnalyticsEngine.from_processor)
+    data_plots = DataPlots(data_processor, product_df, purchase_lines_df, purchase_header_df, analytics)
     data_plots.plots()
 
 def query_tool():
-    query_tool = QueryTool(product_df, purchase_lines_df, purchase_header_df)
+    query_tool = QueryTool.from_processor(load_data())
     query_tool.purchase_info()
     query_tool.product_info()
     query_tool.purchases_by_date()
+    query_tool.bulk_lookup()
 
 def models():
     st.title("Future Purchase Prediction")
-    st.header("DISCLAIMER: Page is slow, please be patient")
+    data_processor = load_data()
+    product_df = data_processor.get_df('product')
+    purchase_header_df = data_processor.get_df('purchase_header')
+    purchase_lines_df = data_processor.get_df('purchase_lines')
 
     # Initialize ModelTrainer
-    model_trainer = ModelTrainer(product_df, purchase_lines_df, purchase_header_df)
-    model_trainer.train_and_evaluate()
+    model_trainer = ModelTrainer(product_df, purchase_lines_df, purchase_header_df, data_processor)
 
     # Select Product ID and Model
     product_id = st.selectbox("Select Product ID", model_trainer.data['PRODUCT_ID'].unique())
-    model_name = st.selectbox("Select Model", list(model_trainer.models.keys()))
+    trained_models = model_trainer.trained_models()
+    if not trained_models:
+        st.warning("No trained models found. Run `python train.py` to train them.")
+        return
+    model_name = st.selectbox("Select Model", trained_models)
+
+    # Only the selected model is deserialized and evaluated
+    model_trainer.train_and_evaluate([model_name])
 
     # User input for future date
     future_date = st.date_input("Select a future date for prediction")
@@ -55,11 +72,8 @@ def models():
     start_date = st.date_input("Select the start date for forecast plot")
     end_date = st.date_input("Select the end date for forecast plot", start_date + pd.DateOffset(months=18))
 
-    # Load selected model
-    selected_model = load_model(model_name)
-
-    # Forecast Prediction
-    future_df, department = model_trainer.get_purchase_forecast(selected_model, model_trainer.data, product_id, start_date, end_date)
+    # Forecast Prediction, from the precomputed forecast table when it is current
+    future_df, department = model_trainer.product_forecast(model_name, product_id, start_date, end_date)
 
     # Display results
     st.write(f"## Predictions for Product {product_id}")
@@ -78,14 +92,34 @@ def models():
 
     # Predict Co-Purchased Products
     st.write("## Co-Purchase Prediction")
-    model_trainer.predict_co_purchases(purchase_lines_df, product_id)
+    co_purchase = data_processor.get_resource('co_purchase', CoPurchaseEngine.from_processor)
+    model_trainer.predict_co_purchases(purchase_lines_df, product_id, co_purchase)
 
 def conclusion():
     ConclusionPage.load_project_conclusiom()
 
 def navbar():
     selected = st.sidebar.radio("Menu", ["Home 🏡", "Data Analysis 📊", "Query Tool 🔍", "ML Modeling 🤖", "Conclusions + Next Steps 🚀"])
-    
+    with instrumentation.stage(f"page {selected}"):
+        render_page(selected)
+
+# While the warm-up is still building what a page needs, shows its progress and polls instead of
+# building the same things a second time in this session
+def warmed_up(selected):
+    current = warmup.current()
+    tasks = warmup.PAGE_TASKS.get(selected, [])
+    pending = current.pending(tasks) if current is not None else []
+    if not pending:
+        return True
+    st.info(f"The server is still preparing this page ({', '.join(pending)}). It will load as soon as that's done.")
+    st.progress(1 - len(pending) / len(tasks))
+    time.sleep(1)
+    st.rerun()
+
+def render_page(selected):
+    if not warmed_up(selected):
+        return
+
     if selected == "Home 🏡":
         home()
 
@@ -101,9 +135,29 @@ def navbar():
     elif selected == "Conclusions + Next Steps 🚀":
         conclusion()
 
+# Timings of this rerun's stages plus a JSON lines export of recent runs
+def diagnostics_panel():
+    if not st.sidebar.checkbox("Show diagnostics", key='show_diagnostics'):
+        return
+    with st.sidebar.expander("Diagnostics", expanded=True):
+        stages = instrumentation.stages_frame(instrumentation.current_run())
+        st.write(f"This run: {stages.loc[stages['depth'] == 0, 'wall_ms'].sum():.0f} ms")
+        st.dataframe(stages[['stage', 'wall_ms', 'cpu_ms', 'peak_mb', 'rows']], hide_index=True)
+        if not instrumentation.memory_tracing_enabled():
+            st.caption("Peak memory is only recorded when the server runs with DIAGNOSTICS_MEMORY=1.")
+        st.write("Table memory")
+        st.dataframe(load_data().get_resource('memory_report', DataProcessor.memory_report), hide_index=True)
+        current = warmup.current()
+        if current is not None:
+            st.write("Warm-up")
+            st.dataframe(pd.DataFrame.from_dict(current.status, orient='index'))
+        st.download_button("Export stage log (JSON lines)", instrumentation.export_jsonl(instrumentation.recent_stages()),
+            file_name='diagnostics.jsonl', mime='application/json')
+
 # Main Function
 def main():
     navbar()
+    diagnostics_panel()
 
 # Entry Point
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+import synthetic_data
+from data_processor import DataProcessor
+from query_index import QueryIndex
+from co_purchase import CoPurchaseEngine
+from queries import PurchaseQueries
+from analytics import AnalyticsEngine, department_summary
+from modeling import ForecastModels, build_model
+from model_registry import ModelRegistry
+from metrics_store import MetricsStore
+import features
+from features import PANEL_FEATURES
+from predictors import Predictor
+
+# Times the hot paths (loading, materialization, queries, analytics, plot data, features,
+# evaluation and forecasting) on synthetic data of a chosen size and records the results as JSON,
+# so runs from different commits can be compared with --compare.
+#   python benchmark.py --products 10000 --lines 10000000
+# Plot benchmarks time the figure builders behind each DataPlots.plot_* (their Streamlit
+# rendering is not timed); query benchmarks time the PurchaseQueries behind each QueryTool view.
+
+class Benchmark:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    # Runs func `repeat` times (setup() before each run, untimed) and records the median
+    def measure(self, name, func, setup=None, repeat=None):
+        runs = []
+        for _ in range(repeat or self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            value = func()
+            runs.append(time.perf_counter() - start)
+        seconds = float(np.median(runs))
+        self.results.append({'name': name, 'seconds': seconds, 'runs': runs})
+        print(f"{name:<55} {seconds * 1000:12.1f} ms")
+        return value
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(bench, data_dir, model_dir):
+    DataProcessor.clear_cache()
+    data_processor = bench.measure('DataProcessor() first run (dataset build + load)', lambda: DataProcessor(data_dir), repeat=1)
+    bench.measure('DataProcessor.load_data (cold)', data_processor.load_data, setup=DataProcessor.clear_cache)
+    bench.measure('DataProcessor.load_data (cached)', data_processor.load_data)
+    # Published once as Arrow IPC, then mapped by every process instead of read and converted
+    shared_processor = DataProcessor(data_dir, shared=True)
+    bench.measure('DataProcessor.load_data (cold, memory-mapped)', shared_processor.load_data, setup=DataProcessor.clear_cache)
+    data_processor.dataframes = data_processor.load_data()
+    bench.measure('DataProcessor.materialize', lambda: data_processor.materialize(force=True), repeat=1)
+
+    product_df = data_processor.get_df('product')
+    purchase_lines_df = data_processor.get_df('purchase_lines')
+    purchase_header_df = data_processor.get_df('purchase_header')
+    index = bench.measure('QueryIndex build', lambda: QueryIndex(product_df, purchase_lines_df, purchase_header_df), repeat=1)
+    co_purchase = bench.measure('CoPurchaseEngine build', lambda: CoPurchaseEngine(purchase_lines_df), repeat=1)
+
+    # Query tool lookups on a typical purchase, the most popular product and the busiest day
+    queries = PurchaseQueries(product_df, purchase_lines_df, purchase_header_df, index, co_purchase, data_processor)
+    purchase_id = purchase_header_df['PURCHASE_ID'].iloc[len(purchase_header_df) // 2]
+    product_id = purchase_lines_df['PRODUCT_ID'].value_counts().index[0]
+    busiest_day = purchase_header_df['PURCHASE_DATE_TIME'].dt.date.value_counts().index[0]
+    rng = np.random.default_rng(0)
+    bench.measure('QueryTool.purchase_info (purchase)', lambda: queries.purchase(purchase_id))
+    bench.measure('QueryTool.product_info (product_purchases)', lambda: queries.product_purchases(product_id))
+    bench.measure('QueryTool.product_info (top_co_purchases)', lambda: queries.top_co_purchases(product_id, 5))
+    bench.measure('QueryTool.purchases_by_date (scan)', lambda: queries.merge_product_details(queries.purchases_on(busiest_day)[1]))
+    bench.measure('QueryTool.bulk_lookup (1000 purchases)',
+        lambda: queries.bulk_purchase_lookup(rng.choice(purchase_header_df['PURCHASE_ID'].to_numpy(), 1000, replace=False)))
+    bench.measure('QueryTool.bulk_lookup (100 products)',
+        lambda: queries.bulk_product_lookup(rng.choice(product_df['PRODUCT_ID'].to_numpy(), 100, replace=False)))
+
+    # Plot data for every DataPlots.plot_*, per available analytics backend
+    product_df['VOLUME'] = product_df['HEIGHT_INCHES'] * product_df['WIDTH_INCHES'] * product_df['DEPTH_INCHES']
+    bench.measure('DataPlots.plot_categorical_summary', lambda: department_summary(product_df))
+    bench.measure('DataPlots.plot_basic_stats', lambda: product_df.drop(columns=['PRODUCT_ID']).describe())
+    from data_analysis_page import DataPlots
+    backends = ['pandas']
+    try:
+        import duckdb
+        backends.append('duckdb')
+    except ImportError:
+        pass
+    for backend in backends:
+        plots = DataPlots(data_processor, product_df, purchase_lines_df, purchase_header_df, AnalyticsEngine(data_processor, backend))
+        for name, func in [
+            ('plot_correlation_heatmap', plots.correlation_heatmap_png),
+            ('plot_top_products', plots.top_products_figure),
+            ('plot_quantity_analysis', plots.quantity_analysis_figures),
+            ('plot_hourly_products', plots.hourly_products),
+            ('plot_purchase_over_time', plots.purchases_over_time_figure),
+            ('plot_purchase_over_time (departments)', lambda: plots.department_purchases_figure(('Produce', 'Snacks'))),
+            ('plot_purchases_by_department', plots.purchases_by_department_figure),
+            ('count_missing_values', lambda: [plots.analytics.missing_values(table) for table in ['purchase_lines', 'purchase_header']])
+        ]:
+            if name == 'plot_correlation_heatmap' and backend != 'pandas':
+                continue
+            bench.measure(f"DataPlots.{name} [{backend}]", func)
+
+    # Popularity views answered from the sketches against the exact rollups
+    bench.measure('DataProcessor.load_popularity', data_processor.load_popularity)
+    for statistics in ['sketch', 'exact']:
+        analytics = AnalyticsEngine(data_processor, 'pandas', statistics)
+        bench.measure(f"AnalyticsEngine.top_products [{statistics}]", analytics.top_products)
+        bench.measure(f"AnalyticsEngine.hourly_extremes [{statistics}]", analytics.hourly_extremes)
+
+    # Modeling: data preparation, features, evaluation and forecasting. Two fast models are
+    # fitted into a scratch registry so train_and_evaluate has something to evaluate.
+    trainer = bench.measure('ModelTrainer.prepare_data',
+        lambda: ForecastModels(product_df, purchase_lines_df, purchase_header_df, data_processor))
+    trainer.registry = ModelRegistry(model_dir)
+    trainer.metrics_store = MetricsStore(os.path.join(model_dir, 'metrics.parquet'))
+    bench.measure('ModelTrainer.create_features (cold)', lambda: trainer.create_features(trainer.data),
+        setup=features._FEATURE_CACHE.clear)
+    bench.measure('ModelTrainer.create_features (cached)', lambda: trainer.create_features(trainer.data))
+
+    model_names = ['Linear Regression', 'Decision Tree']
+    X_train, y_train, X_test, y_test = trainer.train_test_splits()
+    for model_name in model_names:
+        model = bench.measure(f"fit {model_name}", lambda: build_model(model_name).fit(X_train, y_train), repeat=1)
+        trainer.save_model(model_name, model)
+
+    def clear_metrics():
+        if os.path.exists(trainer.metrics_store.path):
+            os.remove(trainer.metrics_store.path)
+    bench.measure('ModelTrainer.train_and_evaluate (cold)', lambda: trainer.train_and_evaluate(model_names), setup=clear_metrics)
+    bench.measure('ModelTrainer.train_and_evaluate (stored metrics)', lambda: trainer.train_and_evaluate(model_names))
+
+    models = {model_name: trainer.load_model(model_name) for model_name in model_names}
+    row = X_test[PANEL_FEATURES].iloc[:1]
+    for model_name, model in models.items():
+        predictor = Predictor.for_model(model)
+        X = row[predictor.features].to_numpy(dtype=np.float32)
+        bench.measure(f"model.predict single row x1000 [{model_name}]", lambda: [model.predict(row[predictor.features]) for _ in range(1000)])
+        bench.measure(f"Predictor.predict single row x1000 [{model_name}]", lambda: [predictor.predict(X) for _ in range(1000)])
+    start = trainer.data['PURCHASE_DATE'].max() + pd.Timedelta(days=1)
+    end = start + pd.DateOffset(months=18)
+    bench.measure('ModelTrainer.get_purchase_forecast (18 months)',
+        lambda: trainer.get_purchase_forecast(models['Decision Tree'], trainer.data, product_id, start, end))
+    bench.measure('ModelTrainer.get_batch_forecast (all products, 2 models)',
+        lambda: trainer.get_batch_forecast(models, trainer.data['PRODUCT_ID'].unique(), start, end))
+    memory = data_processor.memory_report()
+    print(memory.drop(columns=['dtypes']).to_string(index=False))
+    return {name: len(df) for name, df in data_processor.dataframes.items()}, memory.to_dict('records')
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {result['name']: result['seconds'] for result in json.load(f)['results']}
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        if result['name'] in baseline:
+            ratio = result['seconds'] / baseline[result['name']] if baseline[result['name']] else float('inf')
+            print(f"{result['name']:<55} {ratio:8.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app's hot paths on synthetic data")
+    parser.add_argument('--data-dir', help="Benchmark an existing data directory instead of generating one (it is modified: dataset and derived tables are built)")
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--lines', type=int, default=1_000_000, help="Approximate number of purchase lines")
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per benchmark (the median is recorded)")
+    parser.add_argument('--output', help="Results file (default: benchmark_results/<time>-<commit>.json)")
+    parser.add_argument('--compare', help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    bench = Benchmark(args.repeat)
+    scratch = tempfile.mkdtemp(prefix='benchmark-')
+    try:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = os.path.join(scratch, 'data')
+            tables = bench.measure('synthetic_data.generate', lambda: synthetic_data.generate(args.products, args.lines, args.days, seed=args.seed), repeat=1)
+            synthetic_data.write(tables, data_dir)
+            del tables
+        rows, memory = run_benchmarks(bench, data_dir, os.path.join(scratch, 'models'))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    commit = git_commit()
+    output = args.output or os.path.join('benchmark_results', f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            'rows': rows,
+            'memory': memory,
+            'results': bench.results
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(bench.results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+class CoPurchaseEngine:
+    # Builds a sparse basket x product incidence matrix once and derives the product x product
+    # co-occurrence matrix from it; every query afterwards is a single sparse row lookup
+    def __init__(self, purchase_lines_df):
+        basket_codes, _ = pd.factorize(purchase_lines_df['PURCHASE_ID'])
+        product_codes, product_ids = pd.factorize(purchase_lines_df['PRODUCT_ID'])
+        self.product_ids = np.asarray(product_ids)
+        self.product_index = pd.Index(self.product_ids)
+        self.n_baskets = len(np.unique(basket_codes))
+
+        incidence = sparse.csr_matrix(
+            (np.ones(len(basket_codes), dtype=np.int32), (basket_codes, product_codes)),
+            shape=(self.n_baskets, len(self.product_ids)))
+        # A product listed twice in one basket still counts as one co-occurrence
+        incidence.data[:] = 1
+
+        self.co_occurrence = (incidence.T @ incidence).tocsr()
+        self.basket_counts = self.co_occurrence.diagonal()
+
+    @classmethod
+    def from_processor(cls, data_processor):
+        return cls(data_processor.get_df('purchase_lines'))
+
+    def product_stats(self, product_id):
+        pos = self.product_index.get_indexer([product_id])[0]
+        if pos < 0:
+            return pd.DataFrame(columns=['PRODUCT_ID', 'CO_PURCHASE_COUNT', 'CONFIDENCE', 'LIFT', 'JACCARD'])
+
+        start, end = self.co_occurrence.indptr[pos], self.co_occurrence.indptr[pos + 1]
+        others = self.co_occurrence.indices[start:end]
+        counts = self.co_occurrence.data[start:end]
+        keep = others != pos
+        others, counts = others[keep], counts[keep]
+
+        support = self.basket_counts[pos]
+        other_support = self.basket_counts[others]
+        return pd.DataFrame({
+            'PRODUCT_ID': self.product_ids[others],
+            'CO_PURCHASE_COUNT': counts,
+            'CONFIDENCE': counts / support,
+            'LIFT': counts * self.n_baskets / (support * other_support),
+            'JACCARD': counts / (support + other_support - counts)
+        })
+
+    # Top k co-purchased products ranked by count, confidence, lift or jaccard
+    def top_k(self, product_id, k=5, by='CO_PURCHASE_COUNT'):
+        stats = self.product_stats(product_id)
+        return stats.sort_values([by, 'PRODUCT_ID'], ascending=[False, True]).head(k).reset_index(drop=True)
@@ -1,28 +1,81 @@
+import io
+import hashlib
+import threading
+from collections import OrderedDict
 import streamlit as st
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 from datetime import datetime
+from analytics import AnalyticsEngine, department_summary
+from instrumentation import instrumented, stage
+
+# Computed plot data and built figures shared across sessions and reruns. Keys carry the data
+# version and the widget inputs a chart depends on, so a widget change rebuilds only its chart.
+_FIGURE_CACHE = OrderedDict()
+_FIGURE_CACHE_LOCK = threading.Lock()
+FIGURE_CACHE_SIZE = 64
 
 class DataPlots:
-    
-    def __init__(self, data_processor, product_df, purchase_lines_df, purchase_header_df):
+
+    def __init__(self, data_processor, product_df, purchase_lines_df, purchase_header_df, analytics=None):
         self.data_processor = data_processor
+        # Every aggregate below comes from the analytics engine as a small result frame
+        self.analytics = analytics if analytics is not None else AnalyticsEngine(data_processor, 'pandas')
         self.product_df = product_df
         self.purchase_lines_df = purchase_lines_df
         self.purchase_header_df = purchase_header_df
         self.product_df['VOLUME'] = self.product_df['HEIGHT_INCHES'] * self.product_df['WIDTH_INCHES'] * self.product_df['DEPTH_INCHES']
+        self.data_version = hashlib.sha256(repr((data_processor.data_version(), self.analytics.backend, self.analytics.statistics)).encode()).hexdigest()[:16]
+
+    # Returns build() memoized under (data version, name, widget inputs), evicting least recently used
+    def cached(self, name, build, *inputs):
+        key = (self.data_version, name) + inputs
+        with _FIGURE_CACHE_LOCK:
+            if key in _FIGURE_CACHE:
+                _FIGURE_CACHE.move_to_end(key)
+                return _FIGURE_CACHE[key]
+
+        with stage(f"build {name}"):
+            value = build(*inputs)
+        with _FIGURE_CACHE_LOCK:
+            _FIGURE_CACHE[key] = value
+            while len(_FIGURE_CACHE) > FIGURE_CACHE_SIZE:
+                _FIGURE_CACHE.popitem(last=False)
+        return value
+
+    @staticmethod
+    def clear_cache():
+        with _FIGURE_CACHE_LOCK:
+            _FIGURE_CACHE.clear()
+
+    # Builds every chart that doesn't depend on a widget, e.g. from the warm-up at server start
+    def warm_cache(self):
+        for name, build in [
+            ('missing_values', self.missing_values),
+            ('basic_stats', self.basic_stats),
+            ('department_summary', lambda: department_summary(self.product_df)),
+            ('correlation_heatmap', self.correlation_heatmap_png),
+            ('top_products', self.top_products_figure),
+            ('quantity_analysis', self.quantity_analysis_figures),
+            ('hourly_products', self.hourly_products),
+            ('purchases_over_time', self.purchases_over_time_figure),
+            ('purchases_by_department', self.purchases_by_department_figure)
+        ]:
+            self.cached(name, build)
+
+    def missing_values(self):
+        return {
+            'Product DataFrame': self.product_df.isnull().sum(),
+            'Purchase Lines DataFrame': self.analytics.missing_values('purchase_lines'),
+            'Purchase Header DataFrame': self.analytics.missing_values('purchase_header')
+        }
 
     # Count missing values
+    @instrumented()
     def count_missing_values(self):
-        
-        missing_values = {
-            'Product DataFrame': self.product_df.isnull().sum(),
-            'Purchase Lines DataFrame': self.purchase_lines_df.isnull().sum(),
-            'Purchase Header DataFrame': self.purchase_header_df.isnull().sum()
-        }
+
+        missing_values = self.cached('missing_values', self.missing_values)
 
         st.write("### Missing Values Summary")
         col1, col2, col3 = st.columns(3)
@@ -39,36 +92,45 @@ class DataPlots:
             st.write(missing_values['Purchase Header DataFrame'].to_frame(name='Count'))
 
 
+    @instrumented()
     def plot_basic_stats(self):
         st.write("## Basic Statistics of Numerical Data")
-        st.write(self.product_df.describe())
+        st.write(self.cached('basic_stats', self.basic_stats))
+
+    def basic_stats(self):
+        return self.product_df.drop(columns=['PRODUCT_ID']).describe()
 
+    @instrumented()
     def plot_categorical_summary(self):
         st.write("## Categorical Column Summaries (in inches)")
-        stats = ['mean', 'min', 'max', 'std']
-        columns = ['HEIGHT_INCHES', 'WIDTH_INCHES', 'DEPTH_INCHES', 'WEIGHT_GRAMS', 'VOLUME']
-
-        agg_dict = {col: stats for col in columns}
-        agg_dict['PRODUCT_ID'] = 'count'
-        department_summary = self.product_df.groupby('DEPARTMENT_NAME').agg(agg_dict).reset_index()
-        department_summary.columns = ['_'.join(col).strip() if col[1] else col[0] for col in department_summary.columns.values]
-        rename_dict = {f'{col}_{stat}': f'{stat.capitalize()} {col.split("_")[0].capitalize()}' for col in columns for stat in stats}
-        rename_dict['PRODUCT_ID_count'] = 'Count'
-        department_summary.rename(columns=rename_dict, inplace=True)
-        
-        cols = ['DEPARTMENT_NAME', 'Count'] + [col for col in department_summary.columns if col not in ['DEPARTMENT_NAME', 'Count']]
-        department_summary = department_summary[cols]
-
-        st.dataframe(department_summary)
+        st.dataframe(self.cached('department_summary', lambda: department_summary(self.product_df)))
 
-    def plot_correlation_heatmap(self):
-        st.write("## Correlation Heatmap for Product Dataset")
+    # The heatmap is kept as PNG bytes so the matplotlib figure is drawn once per data version
+    def correlation_heatmap_png(self):
+        # seaborn/matplotlib are only needed here, so they're imported on first draw
+        import seaborn as sns
+        import matplotlib.pyplot as plt
         fig, ax = plt.subplots()
-        sns.heatmap(self.product_df.select_dtypes(include=['float64', 'int64']).corr(), annot=True, cmap='coolwarm', ax=ax)
+        sns.heatmap(self.product_df.drop(columns=['PRODUCT_ID']).select_dtypes(include='number').corr(), annot=True, cmap='coolwarm', ax=ax)
         ax.set_title('Correlation Heatmap')
-        st.pyplot(fig)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', bbox_inches='tight')
+        plt.close(fig)
+        return buffer.getvalue()
 
-    def plot_interactive_bar(self, department_summary):
+    @instrumented()
+    def plot_correlation_heatmap(self):
+        st.write("## Correlation Heatmap for Product Dataset")
+        st.image(self.cached('correlation_heatmap', self.correlation_heatmap_png))
+
+    def interactive_bar_figure(self, measurement, stat_type, column_name):
+        summary = self.cached('department_summary', lambda: department_summary(self.product_df))
+        return px.bar(summary, x='DEPARTMENT_NAME', y=column_name,
+            title=f'{stat_type} of {measurement} by Department' if measurement != 'Count' else 'Count by Department',
+            labels={'DEPARTMENT_NAME': 'Department', column_name: f'{stat_type} {measurement}' if measurement != 'Count' else 'Count'})
+
+    @instrumented()
+    def plot_interactive_bar(self):
         st.write("## Interactive Bar Plot for Product Statistics")
         col1, col2 = st.columns([1, 3])
         with col1:
@@ -76,36 +138,26 @@ class DataPlots:
             stat_type = st.selectbox("Select Statistic", options=['Mean', 'Min', 'Max', 'Std']) if measurement != 'Count' else 'Count'
             column_name = f'{stat_type} {measurement}' if measurement != 'Count' else 'Count'
         with col2:
-            fig = px.bar(department_summary, x='DEPARTMENT_NAME', y=column_name, 
-                title=f'{stat_type} of {measurement} by Department' if measurement != 'Count' else 'Count by Department',
-                labels={'DEPARTMENT_NAME': 'Department', column_name: f'{stat_type} {measurement}' if measurement != 'Count' else 'Count'})
-            st.plotly_chart(fig)
-
-    def plot_top_products(self):
-        merged_df = self.purchase_lines_df.merge(self.product_df, on='PRODUCT_ID')
-
-        # Count the number of purchases for each product
-        product_popularity = merged_df['PRODUCT_ID'].value_counts()
-
-        # Calculate the total quantity purchased for each product
-        product_quantities = merged_df.groupby('PRODUCT_ID')['QUANTITY'].sum()
+            st.plotly_chart(self.cached('interactive_bar', self.interactive_bar_figure, measurement, stat_type, column_name))
 
-        # Extract the top 10 most purchased products
-        top_product_ids = product_popularity.head(10).index
+    def top_products_figure(self):
+        # Number of purchases and total quantity of the top 10 most purchased products
+        product_totals = self.analytics.top_products(10).set_index('PRODUCT_ID')
+        top_product_ids = product_totals.index
 
         # Extract details of top products
         top_products = self.product_df[self.product_df['PRODUCT_ID'].isin(top_product_ids)].set_index('PRODUCT_ID')
-        top_products['PURCHASE_COUNT'] = product_popularity[top_product_ids]
-        top_products['TOTAL_QUANTITY'] = product_quantities[top_product_ids]
+        top_products['PURCHASE_COUNT'] = product_totals['LINE_COUNT']
+        top_products['TOTAL_QUANTITY'] = product_totals['QUANTITY']
 
         # Combine Product ID, Department Name, and Total Quantity for the plot
-        top_products['Product_Info'] = top_products.index.astype(str) + " (" + top_products['DEPARTMENT_NAME'] + "), Total Qty: " + top_products['TOTAL_QUANTITY'].astype(str)
+        top_products['Product_Info'] = top_products.index.astype(str) + " (" + top_products['DEPARTMENT_NAME'].astype(str) + "), Total Qty: " + top_products['TOTAL_QUANTITY'].astype(str)
 
         # Create a Plotly bar plot
-        fig = px.bar(top_products, 
-            x='PURCHASE_COUNT', 
-            y='Product_Info', 
-            orientation='h', 
+        fig = px.bar(top_products,
+            x='PURCHASE_COUNT',
+            y='Product_Info',
+            orientation='h',
             title='Top 10 Most Purchased Products',
             labels={'PURCHASE_COUNT': 'Number of Purchases', 'Product_Info': 'Product (Department, Total Quantity)'})
 
@@ -117,187 +169,153 @@ class DataPlots:
             width=800,
             height=600
         )
-        st.plotly_chart(fig)
+        return fig
 
-    def plot_quantity_analysis(self):
-        st.write("## Time vs Quantity Purchased Plots")
-
-        # Merge purchase lines with product data
-        merged_df = self.purchase_lines_df.merge(self.product_df, on='PRODUCT_ID')
-
-        # Merge with purchase header to get purchase date
-        merged_df = merged_df.merge(self.purchase_header_df[['PURCHASE_ID', 'PURCHASE_DATE_TIME']], on='PURCHASE_ID')
+    @instrumented()
+    def plot_top_products(self):
+        st.plotly_chart(self.cached('top_products', self.top_products_figure))
 
-        # Convert 'PURCHASE_DATE_TIME' to datetime
-        merged_df['PURCHASE_DATE_TIME'] = pd.to_datetime(merged_df['PURCHASE_DATE_TIME'])
+    def quantity_analysis_figures(self):
+        # Daily and department x day aggregates of the fact table
+        daily = self.analytics.daily()
+        department_daily = self.analytics.department_daily()
 
         # Calculate total purchase quantity per day
-        merged_df['PURCHASE_DATE'] = merged_df['PURCHASE_DATE_TIME'].dt.date
-        daily_purchase_quantity = merged_df.groupby('PURCHASE_DATE')['QUANTITY'].sum()
+        daily_purchase_quantity = daily.set_index('PURCHASE_DATE')['QUANTITY']
 
         # Plot total purchase quantity over time
-        fig = go.Figure(data=go.Scatter(x=daily_purchase_quantity.index, y=daily_purchase_quantity.values, mode='lines'))
-        fig.update_layout(title='Total Purchase Quantity Over Time', xaxis_title='Date', yaxis_title='Total Purchase Quantity')
-        st.plotly_chart(fig)
+        fig_total = go.Figure(data=go.Scatter(x=daily_purchase_quantity.index, y=daily_purchase_quantity.values, mode='lines'))
+        fig_total.update_layout(title='Total Purchase Quantity Over Time', xaxis_title='Date', yaxis_title='Total Purchase Quantity')
 
         # Analyze purchase patterns by department
-        department_purchase = merged_df.groupby(['DEPARTMENT_NAME', 'PURCHASE_DATE'])['QUANTITY'].sum().reset_index()
+        department_purchase = department_daily[['DEPARTMENT_NAME', 'PURCHASE_DATE', 'QUANTITY']]
 
         # Plot purchase trends by department
-        fig = px.line(department_purchase, x='PURCHASE_DATE', y='QUANTITY', color='DEPARTMENT_NAME', title='Purchase Trends by Department')
-        st.plotly_chart(fig)
+        fig_trends = px.line(department_purchase, x='PURCHASE_DATE', y='QUANTITY', color='DEPARTMENT_NAME', title='Purchase Trends by Department')
 
         # Analyze average purchase quantity by department
-        avg_purchase_by_department = merged_df.groupby('DEPARTMENT_NAME')['QUANTITY'].mean().sort_values(ascending=False)
+        department_totals = department_daily.groupby('DEPARTMENT_NAME', observed=True)[['QUANTITY', 'LINE_COUNT']].sum()
+        avg_purchase_by_department = (department_totals['QUANTITY'] / department_totals['LINE_COUNT']).sort_values(ascending=False)
 
         # Visualize average purchase quantity by department
-        fig = go.Figure(data=go.Bar(x=avg_purchase_by_department.values, y=avg_purchase_by_department.index, orientation='h'))
-        fig.update_layout(title='Average Purchase Quantity by Department', xaxis_title='Average Purchase Quantity', yaxis_title='Department')
-        st.plotly_chart(fig)
-
-    
+        fig_average = go.Figure(data=go.Bar(x=avg_purchase_by_department.values, y=avg_purchase_by_department.index, orientation='h'))
+        fig_average.update_layout(title='Average Purchase Quantity by Department', xaxis_title='Average Purchase Quantity', yaxis_title='Department')
+        return fig_total, fig_trends, fig_average
 
-    def plot_hourly_products(self):
-        
-        self.purchase_header_df['PURCHASE_DATE_TIME'] = pd.to_datetime(self.purchase_header_df['PURCHASE_DATE_TIME'])
+    @instrumented()
+    def plot_quantity_analysis(self):
+        st.write("## Time vs Quantity Purchased Plots")
+        for fig in self.cached('quantity_analysis', self.quantity_analysis_figures):
+            st.plotly_chart(fig)
 
-        # Extracting purchase hour
-        self.purchase_header_df['PURCHASE_HOUR'] = self.purchase_header_df['PURCHASE_DATE_TIME'].dt.hour
-        merged_df = self.purchase_lines_df.merge(self.product_df, on='PRODUCT_ID')
-        merged_df = merged_df.merge(self.purchase_header_df[['PURCHASE_ID', 'PURCHASE_HOUR']], on='PURCHASE_ID')
 
-        # Group by purchase hour and product ID
-        hourly_products_count = merged_df.groupby(['PURCHASE_HOUR', 'PRODUCT_ID']).size().reset_index(name='COUNT')
 
+    def hourly_products(self):
         # Find the most popular and least bought product for each hour
-        idx_max = hourly_products_count.groupby('PURCHASE_HOUR')['COUNT'].transform(max) == hourly_products_count['COUNT']
-        hourly_most_popular_products = hourly_products_count[idx_max]
-        
-
-        idx_min = hourly_products_count.groupby('PURCHASE_HOUR')['COUNT'].transform(min) == hourly_products_count['COUNT']
-        hourly_least_bought_products = hourly_products_count[idx_min]
+        hourly_most_popular_products, hourly_least_bought_products = self.analytics.hourly_extremes()
 
         # Merge with product_df to get department name
         hourly_most_popular_products = hourly_most_popular_products.merge(self.product_df, on='PRODUCT_ID', how='left')
         hourly_least_bought_products = hourly_least_bought_products.merge(self.product_df, on='PRODUCT_ID', how='left')
-        
-        st.write("## Most Popular Product bought each Hour")
-        st.write(hourly_most_popular_products)
-
-        st.write("## Least Bought Product bought each Hour")
-        st.write(hourly_least_bought_products)
 
         # Counting purchases by hour
-        purchase_by_hour = self.purchase_header_df['PURCHASE_HOUR'].value_counts().sort_index()
+        purchase_by_hour = self.analytics.purchases_by_hour()
 
         # Plotting the distribution of purchases by hour
         fig = px.bar(x=purchase_by_hour.index, y=purchase_by_hour.values, labels={'x': 'Hour of the Day', 'y': 'Number of Purchases'})
         fig.update_layout(title='Distribution of Purchases by Hour of the Day', xaxis_title='Hour', yaxis_title='Number of Purchases')
-        st.plotly_chart(fig)
 
         # Finding the most popular hour
-        most_popular_hour = purchase_by_hour.idxmax()
+        return hourly_most_popular_products, hourly_least_bought_products, fig, purchase_by_hour.idxmax()
+
+    @instrumented()
+    def plot_hourly_products(self):
+        hourly_most_popular_products, hourly_least_bought_products, fig, most_popular_hour = self.cached('hourly_products', self.hourly_products)
+
+        st.write("## Most Popular Product bought each Hour")
+        st.write(hourly_most_popular_products)
+
+        st.write("## Least Bought Product bought each Hour")
+        st.write(hourly_least_bought_products)
+
+        st.plotly_chart(fig)
         st.write(f"The most popular time of day for purchases is around {most_popular_hour}:00")
 
 
-    def plot_purchase_over_time(self):
-        st.write("## Number of Purchases Over Time")
-        # Convert 'PURCHASE_DATE_TIME' to datetime
-        self.purchase_header_df['PURCHASE_DATE_TIME'] = pd.to_datetime(self.purchase_header_df['PURCHASE_DATE_TIME'])
-        
-        # Extracting purchase date
-        self.purchase_header_df['PURCHASE_DATE'] = self.purchase_header_df['PURCHASE_DATE_TIME'].dt.date
-        
+    def purchases_over_time_figure(self):
         # Counting total purchases per day
-        total_purchases_over_time = self.purchase_header_df['PURCHASE_DATE'].value_counts().sort_index()
+        total_purchases_over_time = self.analytics.daily().set_index('PURCHASE_DATE')['PURCHASE_COUNT']
 
         # Plotting the number of total purchases over time
         fig_total = px.line(x=total_purchases_over_time.index, y=total_purchases_over_time.values, labels={'x': 'Date', 'y': 'Total Number of Purchases'})
         fig_total.update_layout(title='Total Number of Purchases Over Time', xaxis_title='Date', yaxis_title='Total Number of Purchases')
-        st.plotly_chart(fig_total)
-        
+        return fig_total
+
+    def department_purchases_figure(self, selected_departments):
+        # Filter the department x day aggregate by selected departments
+        department_daily = self.analytics.department_daily()
+        purchases_by_department = department_daily[department_daily['DEPARTMENT_NAME'].isin(selected_departments)]
+
+        # Counting purchases by department over time
+        purchases_by_department = purchases_by_department.assign(
+            DEPARTMENT_NAME=purchases_by_department['DEPARTMENT_NAME'].astype(str).str.capitalize(),
+            PURCHASE_ID=purchases_by_department['LINE_COUNT']
+        )
+
+        # Plotting the number of purchases by department over time
+        return px.line(purchases_by_department, x='PURCHASE_DATE', y='PURCHASE_ID', color='DEPARTMENT_NAME',
+            title='Number of Purchases by Department Over Time',
+            labels={'PURCHASE_DATE': 'Date', 'PURCHASE_ID': 'Number of Purchases'})
+
+    @instrumented()
+    def plot_purchase_over_time(self):
+        st.write("## Number of Purchases Over Time")
+        st.plotly_chart(self.cached('purchases_over_time', self.purchases_over_time_figure))
+
         st.write("## Filtered Purchases Over Time by Department")
         # Get unique department names
-        department_names = self.product_df['DEPARTMENT_NAME'].unique()
-        
+        department_names = self.product_df['DEPARTMENT_NAME'].unique().tolist()
+
         selected_departments = st.multiselect("Select Departments", department_names)
 
         if not selected_departments:
             st.warning("Please select at least one department.")
             return
 
-        # Merge 'DEPARTMENT_NAME' from product_df into purchase_lines_df
-        merged_purchase_lines = self.purchase_lines_df.merge(self.product_df[['PRODUCT_ID', 'DEPARTMENT_NAME']], on='PRODUCT_ID')
-
-        # Filter merged purchase lines by selected departments
-        filtered_purchase_lines = merged_purchase_lines[merged_purchase_lines['DEPARTMENT_NAME'].isin(selected_departments)]
-
-        # Merge filtered purchase lines with product data and purchase header
-        merged_df = filtered_purchase_lines.merge(self.purchase_header_df[['PURCHASE_ID', 'PURCHASE_DATE_TIME']], on='PURCHASE_ID')
+        # Selection order doesn't change the chart, so it isn't part of the cache key
+        st.plotly_chart(self.cached('department_purchases', self.department_purchases_figure, tuple(sorted(selected_departments))))
 
-        # Convert 'PURCHASE_DATE_TIME' to datetime
-        merged_df['PURCHASE_DATE_TIME'] = pd.to_datetime(merged_df['PURCHASE_DATE_TIME'])
-
-        # Extracting department name and purchase date
-        merged_df['DEPARTMENT_NAME'] = merged_df['DEPARTMENT_NAME'].str.capitalize()
-        merged_df['PURCHASE_DATE'] = merged_df['PURCHASE_DATE_TIME'].dt.date
-
-        # Counting purchases by department over time
-        purchases_by_department = merged_df.groupby(['DEPARTMENT_NAME', 'PURCHASE_DATE'])['PURCHASE_ID'].count().reset_index()
-
-        # Plotting the number of purchases by department over time
-        fig_department = px.line(purchases_by_department, x='PURCHASE_DATE', y='PURCHASE_ID', color='DEPARTMENT_NAME',
-            title='Number of Purchases by Department Over Time',
-            labels={'PURCHASE_DATE': 'Date', 'PURCHASE_ID': 'Number of Purchases'})
-        st.plotly_chart(fig_department)
 
+    def purchases_by_department_figure(self):
+        department_daily = self.analytics.department_daily()
 
-    def plot_purchases_by_department(self):
-        st.write("## Number of Purchases by Department")
-        # Merge purchase lines with product data
-        merged_df = self.purchase_lines_df.merge(self.product_df, on='PRODUCT_ID')
-        
-        # Merge with purchase header to get purchase date
-        merged_df = merged_df.merge(self.purchase_header_df[['PURCHASE_ID', 'PURCHASE_DATE_TIME']], on='PURCHASE_ID')
-        
         # Extracting department name
-        merged_df['DEPARTMENT_NAME'] = merged_df['DEPARTMENT_NAME'].str.capitalize()
-        
+        department_daily = department_daily.assign(DEPARTMENT_NAME=department_daily['DEPARTMENT_NAME'].astype(str).str.capitalize())
+
         # Counting purchases by department
-        purchases_by_department = merged_df.groupby('DEPARTMENT_NAME')['PURCHASE_ID'].count().sort_values(ascending=False)
+        purchases_by_department = department_daily.groupby('DEPARTMENT_NAME')['LINE_COUNT'].sum().sort_values(ascending=False)
 
         # Plotting the number of purchases by department
         fig = px.bar(x=purchases_by_department.index, y=purchases_by_department.values, labels={'x': 'Department', 'y': 'Number of Purchases'})
         fig.update_layout(title='Number of Purchases by Department', xaxis_title='Department', yaxis_title='Number of Purchases')
-        st.plotly_chart(fig)
+        return fig
+
+    @instrumented()
+    def plot_purchases_by_department(self):
+        st.write("## Number of Purchases by Department")
+        st.plotly_chart(self.cached('purchases_by_department', self.purchases_by_department_figure))
 
 
     def plots(self):
         st.title("Exploring the Data!")
 
         self.count_missing_values()
-      
-        # Common stats used
-        stats = ['mean', 'min', 'max', 'std']
-        columns = ['HEIGHT_INCHES', 'WIDTH_INCHES', 'DEPTH_INCHES', 'WEIGHT_GRAMS', 'VOLUME']
-
-        agg_dict = {col: stats for col in columns}
-        agg_dict['PRODUCT_ID'] = 'count'
-        department_summary = self.product_df.groupby('DEPARTMENT_NAME').agg(agg_dict).reset_index()
-        department_summary.columns = ['_'.join(col).strip() if col[1] else col[0] for col in department_summary.columns.values]
-        rename_dict = {f'{col}_{stat}': f'{stat.capitalize()} {col.split("_")[0].capitalize()}' for col in columns for stat in stats}
-        rename_dict['PRODUCT_ID_count'] = 'Count'
-        department_summary.rename(columns=rename_dict, inplace=True)
-        
-        cols = ['DEPARTMENT_NAME', 'Count'] + [col for col in department_summary.columns if col not in ['DEPARTMENT_NAME', 'Count']]
-        department_summary = department_summary[cols]
-
 
         st.header("Select from the drop down to see different visualizations, or you can see all of them as you scroll down")
         # Dropdown menu to select plots
         plot_functions = {
             "Product Dimension Correlation Heatmap": self.plot_correlation_heatmap,
-            "Product Dimensions stats ": lambda: self.plot_interactive_bar(department_summary),
+            "Product Dimensions stats ": self.plot_interactive_bar,
             "Top Products": self.plot_top_products,
             "Time vs Quantity Purchased": self.plot_quantity_analysis,
             "Hourly Products": self.plot_hourly_products,
@@ -314,7 +332,7 @@ class DataPlots:
         self.plot_basic_stats()
         self.plot_categorical_summary()
         self.plot_correlation_heatmap()
-        self.plot_interactive_bar(department_summary)
+        self.plot_interactive_bar()
         self.plot_top_products()
         self.plot_quantity_analysis()
         self.plot_hourly_products()
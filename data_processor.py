@@ -1,34 +1,675 @@
 import os
+import glob
+import hashlib
+import json
+import time
+import shutil
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-import streamlit as st
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from instrumentation import instrumented, stage
+from sketches import PopularityStats
+
+# Process-wide cache of normalized tables, shared by every DataProcessor (and so by every
+# Streamlit session/rerun). Entries are keyed by parquet path (and whether the table is mapped
+# from data/shared/) and invalidated by file mtime.
+_TABLE_CACHE = {}
+_TABLE_CACHE_LOCK = threading.Lock()
+_MATERIALIZE_LOCK = threading.Lock()
+
+# Process-wide cache of objects derived from the tables (indexes, matrices, ...), keyed by
+# resource name and rebuilt whenever the data version they were built from changes
+_RESOURCE_CACHE = {}
+_RESOURCE_CACHE_LOCK = threading.Lock()
+# One lock per resource, held while it is built: different resources build in parallel, and only
+# requests for the one being built wait for it
+_RESOURCE_BUILD_LOCKS = {}
+
+ID_COLUMNS = ['PRODUCT_ID', 'PURCHASE_ID']
+PURCHASE_DATE_TIME_FORMAT = '%m/%d/%Y %H:%M:%S.%f'
+
+# Compact dtypes applied by normalize() wherever these columns appear, in memory and at rest.
+# IDs (above) are int64 and PURCHASE_DATE_TIME datetime64. Product measurements are only
+# described and multiplied, never summed, so float32's ~7 significant digits are plenty.
+# QUANTITY stays float64: it holds fractional weights that are summed into totals, where
+# float32 would drop the cents.
+COMPACT_DTYPES = {
+    'DEPARTMENT_NAME': 'category',
+    'HEIGHT_INCHES': 'float32',
+    'WIDTH_INCHES': 'float32',
+    'DEPTH_INCHES': 'float32',
+    'WEIGHT_GRAMS': 'float32',
+    'PURCHASE_HOUR': 'int8'
+}
+
+# Purchase tables are stored as hive-style PURCHASE_DATE partitions so date filters prune files
+DATE_PARTITIONED = ['purchase_header', 'purchase_lines']
+PARTITIONING = ds.partitioning(pa.schema([('PURCHASE_DATE', pa.date32())]), flavor='hive')
+
+# Columns every ingested batch must provide
+REQUIRED_COLUMNS = {
+    'purchase_header': ['PURCHASE_ID', 'PURCHASE_DATE_TIME'],
+    'purchase_lines': ['PURCHASE_ID', 'PRODUCT_ID', 'QUANTITY']
+}
+
+# Group keys of each additive rollup, used to fold a new batch into the existing totals
+ROLLUP_KEYS = {
+    'daily': ['PURCHASE_DATE'],
+    'hourly': ['PURCHASE_HOUR', 'PRODUCT_ID'],
+    'department_daily': ['DEPARTMENT_NAME', 'PURCHASE_DATE'],
+    'product_daily': ['PURCHASE_DATE', 'PRODUCT_ID']
+}
+
+def write_parquet_atomic(df, path):
+    # Hidden temp name so directory readers never pick up a half-written file
+    tmp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+# CSV bytes parsed per record batch. The streaming reader reads a few dozen blocks ahead of its
+# consumer, so this, not the file size, bounds the memory of converting a raw extract.
+CSV_BLOCK_SIZE = 1 << 20
+# Converted batches are gathered into row groups of about this many rows
+PARQUET_ROW_GROUP_ROWS = 1 << 20
+
+# Types the CSV reader parses straight into. IDs and timestamps are read as text and cleaned
+# batch by batch in normalize_batch().
+CSV_COLUMN_TYPES = {
+    'PRODUCT_ID': pa.string(),
+    'PURCHASE_ID': pa.string(),
+    'PURCHASE_DATE_TIME': pa.string(),
+    'QUANTITY': pa.float64(),
+    **{col: pa.type_for_alias(dtype) for col, dtype in COMPACT_DTYPES.items() if dtype != 'category'}
+}
+
+# '3/25/2020 1:25:29.5' to timestamps: whole seconds through strptime, plus the fraction in ns
+def parse_purchase_times(strings):
+    parts = pc.extract_regex(strings, r'^(?P<seconds>[^.]*)(?:\.(?P<fraction>\d{1,9}))?$')
+    seconds = pc.strptime(pc.struct_field(parts, 'seconds'), format=PURCHASE_DATE_TIME_FORMAT.replace('.%f', ''), unit='ns')
+    fraction = pc.utf8_slice_codeunits(pc.utf8_rpad(pc.struct_field(parts, 'fraction'), 9, '0'), 0, 9)
+    return pc.add(seconds, pc.cast(pc.cast(fraction, pa.int64()), pa.duration('ns')))
+
+# Arrow counterpart of DataProcessor.normalize for one record batch, with vectorized kernels.
+# DEPARTMENT_NAME stays text (parquet dictionary-encodes it on disk) and becomes categorical on load.
+def normalize_batch(batch):
+    columns = []
+    for name, column in zip(batch.schema.names, batch.columns):
+        if name in ID_COLUMNS and pa.types.is_string(column.type):
+            column = pc.cast(pc.utf8_trim_whitespace(pc.replace_substring(column, ',', '')), pa.int64())
+        elif name == 'PURCHASE_DATE_TIME' and pa.types.is_string(column.type):
+            column = parse_purchase_times(column)
+        columns.append(column)
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+# Normalized record batches of a CSV file in file order. Blocks are parsed by the multi-threaded
+# reader and cleaned on a thread pool (arrow kernels release the GIL), with at most `workers`
+# batches in flight so memory stays bounded.
+def read_csv_batches(csv_path, block_size=CSV_BLOCK_SIZE, workers=None):
+    workers = workers or os.cpu_count() or 1
+    reader = pv.open_csv(csv_path, read_options=pv.ReadOptions(block_size=block_size, use_threads=True),
+        convert_options=pv.ConvertOptions(column_types=CSV_COLUMN_TYPES))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for batch in reader:
+            in_flight.append(executor.submit(normalize_batch, batch))
+            if len(in_flight) >= workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+# Streams a CSV extract of any size into a parquet file, writing row groups as batches arrive,
+# so memory stays constant however big the input is
+def csv_to_parquet(csv_path, parquet_path, block_size=CSV_BLOCK_SIZE, workers=None):
+    tmp_path = os.path.join(os.path.dirname(parquet_path), '.' + os.path.basename(parquet_path) + '.tmp')
+    writer = None
+    row_group = []
+    try:
+        for batch in read_csv_batches(csv_path, block_size, workers):
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, batch.schema)
+            row_group.append(batch)
+            if sum(len(batch) for batch in row_group) >= PARQUET_ROW_GROUP_ROWS:
+                writer.write_table(pa.Table.from_batches(row_group), row_group_size=PARQUET_ROW_GROUP_ROWS)
+                row_group = []
+        if row_group:
+            writer.write_table(pa.Table.from_batches(row_group), row_group_size=PARQUET_ROW_GROUP_ROWS)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"{csv_path} has no rows")
+    os.replace(tmp_path, parquet_path)
+
+# Merges the small ingested parts of a partition or of the fact table (fewer rows than a row
+# group) into the batch just written at `path`, so hourly batches don't leave a file each behind
+# for every load to stat and open. A directory then holds its imported base part, full-sized
+# ingested parts and at most one small one, and each merge rewrites less than a row group.
+def compact_parts(directory, path):
+    small = [part for part in sorted(glob.glob(os.path.join(directory, '*.parquet')))
+        if part != path and os.path.basename(part) != 'part-base.parquet'
+        and pq.ParquetFile(part).metadata.num_rows < PARQUET_ROW_GROUP_ROWS]
+    if not small:
+        return
+    write_parquet_atomic(pd.concat([pd.read_parquet(part) for part in small + [path]], ignore_index=True), path)
+    for part in small:
+        os.remove(part)
+
+# Arrow IPC copies of the normalized tables and rollups under data/shared/, memory-mapped by
+# every process on the host instead of each holding private pandas copies (SHARED_TABLES=1),
+# so the page cache keeps one physical copy however many server processes run. Files are named
+# by the version of the data they hold, so processes agree on them without coordinating, and
+# a new version is a new file.
+SHARED_TABLES = os.environ.get('SHARED_TABLES', '0') == '1'
+
+# Writes df as one record batch. NaN stays a float value instead of becoming an Arrow null, so
+# numeric, datetime and categorical columns convert back to pandas without a copy.
+def write_arrow_atomic(df, path):
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if values.dtype.kind in 'biufmM' and not isinstance(values.dtype, pd.CategoricalDtype):
+            columns[col] = pa.array(values.to_numpy(), from_pandas=False)
+        else:
+            columns[col] = pa.array(values)
+    table = pa.table(columns)
+    # Several processes may publish the same version at once; each writes its own temp file
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+# DataFrame whose columns point into the memory-mapped file. The arrays are read-only: columns
+# can be added or replaced, but not modified in place.
+def map_arrow(path):
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(split_blocks=True, date_as_object=False)
+
+# Marks the arrays behind a cached table read-only, so an in-place write through any view of it
+# (df.loc[...] = ..., df[col].values[...] = ...) raises instead of changing the table every
+# session shares. Adding or replacing whole columns on a view is unaffected.
+def freeze(df):
+    for values in df._mgr.arrays:
+        for attr in ('_codes', '_ndarray'):
+            values = getattr(values, attr, values)
+        if isinstance(values, np.ndarray):
+            values.flags.writeable = False
+    return df
 
 class DataProcessor:
-    def __init__(self):
+    files = ['product', 'purchase_header', 'purchase_lines']
+    # Denormalized fact table and its rollups, materialized under data/derived/
+    derived_tables = ['fact', 'daily', 'hourly', 'department_daily', 'product_daily']
+
+    def __init__(self, base_path="data", shared=None):
+        self.base_path = base_path
+        # Map tables from data/shared/ instead of reading private copies (default: SHARED_TABLES)
+        self.shared = SHARED_TABLES if shared is None else shared
+        self.versions = {}
+        self.build_dataset()
         self.dataframes = self.load_data()
 
     def load_data(self):
-        base_path = "data"
-        files = ['product', 'purchase_header', 'purchase_lines']
         dfs = {}
-        for file in files:
-            csv_path = os.path.join(base_path, f"{file}.csv")
-            parquet_path = os.path.join(base_path, f"{file}.parquet")
-
-            if os.path.exists(parquet_path):
-                df = pd.read_parquet(parquet_path)
-                #st.text(f"Loaded {file} from Parquet file.")  # Loaded parquet file
-            else:
-                df = pd.read_csv(csv_path)
-                for col in ['PRODUCT_ID', 'PURCHASE_ID']:
-                    if col in df.columns:
-                        df[col] = df[col].astype(str).str.replace(',', '')
-                df.to_parquet(parquet_path, index=False)
-                #st.text(f"Converted {file} from CSV to Parquet and saved.")
-            dfs[file] = df
+        for file in self.files:
+            dfs[file] = self.load_table(file)
         return dfs
 
+    def ensure_parquet(self, file, refresh=False):
+        csv_path = os.path.join(self.base_path, f"{file}.csv")
+        parquet_path = os.path.join(self.base_path, f"{file}.parquet")
+
+        if not os.path.exists(parquet_path) or refresh:
+            # Stored in the compact schema, so the import never re-parses text IDs or timestamps
+            csv_to_parquet(csv_path, parquet_path)
+            #st.text(f"Converted {file} from CSV to Parquet and saved.")
+        return parquet_path
+
+    # Identifies the raw extracts the dataset was imported from (mtime and size of each file)
+    def raw_fingerprint(self):
+        fingerprint = {}
+        for file in self.files:
+            fingerprint[file] = []
+            for path in [os.path.join(self.base_path, f"{file}.csv"), os.path.join(self.base_path, f"{file}.parquet")]:
+                if os.path.exists(path):
+                    stat = os.stat(path)
+                    fingerprint[file].append([os.path.basename(path), stat.st_mtime_ns, stat.st_size])
+        return fingerprint
+
+    # Raw fingerprint recorded by the last import, or None
+    def imported_sources(self, marker_path):
+        if not os.path.exists(marker_path):
+            return None
+        with open(marker_path) as f:
+            return json.load(f).get('sources')
+
+    # Imports the raw files into the normalized dataset under data/partitions/: product as a
+    # single file, purchase_header/purchase_lines split by purchase date. The dataset is then the
+    # source of truth and ingested batches are added to it. When a raw file is replaced or updated
+    # the base parts are imported again; ingested batches are kept, minus any purchases the new
+    # extract now holds.
+    @instrumented('DataProcessor.build_dataset')
+    def build_dataset(self):
+        marker_path = os.path.join(self.base_path, 'partitions', '_dataset.json')
+        if self.imported_sources(marker_path) == self.raw_fingerprint():
+            return False
+        with _MATERIALIZE_LOCK:
+            imported, fingerprint = self.imported_sources(marker_path), self.raw_fingerprint()
+            if imported == fingerprint:
+                return False
+            # A CSV extract that changed since the last import replaces its parquet copy
+            csv_entries = lambda sources, file: [entry for entry in sources.get(file, []) if entry[0].endswith('.csv')]
+            base = {file: self.normalize(pd.read_parquet(self.ensure_parquet(file,
+                imported is not None and csv_entries(imported, file) != csv_entries(fingerprint, file)))) for file in self.files}
+
+            purchase_dates = base['purchase_header'].set_index('PURCHASE_ID')['PURCHASE_DATE_TIME'].dt.strftime('%Y-%m-%d')
+            line_dates = base['purchase_lines']['PURCHASE_ID'].map(purchase_dates)
+            if line_dates.isna().any():
+                raise ValueError(f"{line_dates.isna().sum()} purchase lines reference purchases missing from purchase_header")
+
+            for file in self.files:
+                for path in self.partition_files(file):
+                    if os.path.basename(path) == 'part-base.parquet':
+                        os.remove(path)
+                    elif file in DATE_PARTITIONED:
+                        self.drop_purchases(path, base['purchase_header']['PURCHASE_ID'])
+
+            os.makedirs(self.partition_root('product'), exist_ok=True)
+            write_parquet_atomic(base['product'], os.path.join(self.partition_root('product'), 'part-base.parquet'))
+            self.write_partitions('purchase_header', base['purchase_header'], purchase_dates, 'part-base')
+            self.write_partitions('purchase_lines', base['purchase_lines'], purchase_dates, 'part-base')
+
+            with open(marker_path + '.tmp', 'w') as f:
+                json.dump({'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'tables': self.files, 'sources': self.raw_fingerprint()}, f)
+            os.replace(marker_path + '.tmp', marker_path)
+            return True
+
+    # Removes the rows of the given purchases from an ingested partition file
+    @staticmethod
+    def drop_purchases(path, purchase_ids):
+        df = pd.read_parquet(path)
+        kept = df[~df['PURCHASE_ID'].isin(purchase_ids)]
+        if kept.empty:
+            os.remove(path)
+        elif len(kept) < len(df):
+            write_parquet_atomic(kept, path)
+
+    # Writes df into one file per PURCHASE_DATE partition, dating rows through their PURCHASE_ID
+    def write_partitions(self, file, df, purchase_dates, name):
+        for date, part in df.groupby(df['PURCHASE_ID'].map(purchase_dates)):
+            partition = os.path.join(self.partition_root(file), f"PURCHASE_DATE={date}")
+            os.makedirs(partition, exist_ok=True)
+            write_parquet_atomic(part, os.path.join(partition, f"{name}.parquet"))
+
+    # Full table from the dataset, cached under the exact list of file versions it was read from
+    @instrumented('DataProcessor.load_table')
+    def load_table(self, file):
+        paths = self.partition_files(file)
+        version = self.files_version(paths)
+        self.versions[file] = version
+
+        key = (os.path.abspath(self.partition_root(file)), 'table', self.shared)
+        with _TABLE_CACHE_LOCK:
+            cached = _TABLE_CACHE.get(key)
+            if cached is None or cached[0] != version:
+                read = lambda: ds.dataset(paths, format='parquet').to_table().to_pandas()
+                cached = (version, self.load_shared(file, version, read) if self.shared else freeze(self.normalize(read())))
+                _TABLE_CACHE[key] = cached
+        return cached[1]
+
+    # The exact list of file versions a table is read from
+    @staticmethod
+    def files_version(paths):
+        return tuple((os.path.abspath(path), os.path.getmtime(path)) for path in paths)
+
+    def shared_path(self, name, version):
+        digest = hashlib.sha1(repr(version).encode()).hexdigest()[:16]
+        return os.path.join(self.base_path, 'shared', f"{name}-{digest}.arrow")
+
+    # Maps the shared copy of a table version, publishing it first if no process has yet. Files of
+    # other versions are left alone: processes on another data version may be mapping or writing
+    # them. prune_shared() removes them as an explicit step.
+    def load_shared(self, name, version, read):
+        path = self.shared_path(name, version)
+        try:
+            return map_arrow(path)
+        except FileNotFoundError:
+            with stage(f"publish {name}"):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                write_arrow_atomic(self.normalize(read()), path)
+            return map_arrow(path)
+
+    # Removes shared files of every data version but the current one, e.g. after ingesting a
+    # batch (python warmup.py --prune-shared). Processes that already mapped a removed file keep
+    # its pages until they drop it; one that still needs it publishes it again.
+    def prune_shared(self):
+        current = {self.shared_path(file, self.files_version(self.partition_files(file))) for file in self.files}
+        for name in self.derived_tables:
+            path = self.derived_path(name)
+            if os.path.exists(path):
+                current.add(self.shared_path(f"derived-{name}", (os.path.abspath(path), os.path.getmtime(path))))
+        removed = []
+        for path in glob.glob(os.path.join(self.base_path, 'shared', '*.arrow')):
+            if path not in current:
+                try:
+                    os.remove(path)
+                    removed.append(path)
+                except OSError:
+                    pass
+        return removed
+
+    # Reads only the requested columns and rows: column projection plus predicate pushdown, with
+    # PURCHASE_DATE filters pruning whole partitions. filters is either a pyarrow expression or
+    # a list of (column, op, value) tuples, e.g. [('PURCHASE_DATE', '=', date(2020, 4, 6))].
+    @instrumented('DataProcessor.scan')
+    def scan(self, table, columns=None, filters=None):
+        if table in DATE_PARTITIONED:
+            dataset = ds.dataset(self.partition_root(table), format='parquet', partitioning=PARTITIONING)
+        else:
+            dataset = ds.dataset(self.partition_files(table), format='parquet')
+        if isinstance(filters, list):
+            filters = pq.filters_to_expression(filters)
+        result = dataset.to_table(columns=columns, filter=filters).to_pandas(date_as_object=False)
+        return self.normalize(result)
+
+    # Reads a parquet file through the process-wide cache, re-reading only when its mtime changes
+    def read_cached(self, parquet_path):
+        key = (os.path.abspath(parquet_path), self.shared)
+        mtime = os.path.getmtime(parquet_path)
+        with _TABLE_CACHE_LOCK:
+            cached = _TABLE_CACHE.get(key)
+            if cached is None or cached[0] != mtime:
+                if self.shared:
+                    name = 'derived-' + os.path.splitext(os.path.basename(parquet_path))[0]
+                    df = self.load_shared(name, (key[0], mtime), lambda: pd.read_parquet(parquet_path))
+                else:
+                    df = freeze(self.normalize(pd.read_parquet(parquet_path)))
+                cached = (mtime, df)
+                _TABLE_CACHE[key] = cached
+        return cached
+
+    # Normalize dtypes once at load time so no consumer has to re-parse them
+    @staticmethod
+    def normalize(df):
+        for col in ID_COLUMNS:
+            if col in df.columns and not pd.api.types.is_integer_dtype(df[col]):
+                df[col] = df[col].astype(str).str.replace(',', '').astype('int64')
+        if 'PURCHASE_DATE_TIME' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['PURCHASE_DATE_TIME']):
+            # Same parser as the CSV path, so the fraction of a second is optional in both
+            times = parse_purchase_times(pa.array(df['PURCHASE_DATE_TIME'].astype(object), type=pa.string()))
+            df['PURCHASE_DATE_TIME'] = times.to_numpy(zero_copy_only=False)
+        for col, dtype in COMPACT_DTYPES.items():
+            if col in df.columns and df[col].dtype != dtype:
+                df[col] = df[col].astype(dtype)
+        return df
+
+    # Rows and resident size of each core table, next to the size of the same data in the raw
+    # representation (text IDs and department names, float64 numbers). Mapped tables live in
+    # the page cache shared by all processes rather than in this one's heap. Cheap enough for a
+    # diagnostics view; cache it with get_resource('memory_report', DataProcessor.memory_report).
+    def memory_report(self):
+        report = []
+        for file in self.files:
+            df = self.dataframes[file]
+            raw_bytes = 0
+            for col in df.columns:
+                if col in ID_COLUMNS or col == 'DEPARTMENT_NAME':
+                    raw_bytes += df[col].astype(str).memory_usage(deep=True, index=False)
+                else:
+                    raw_bytes += len(df) * max(df[col].dtype.itemsize, 8)
+            memory_bytes = df.memory_usage(deep=True, index=False).sum()
+            report.append({
+                'table': file,
+                'rows': len(df),
+                'memory_mb': memory_bytes / 2**20,
+                'bytes_per_row': memory_bytes / max(len(df), 1),
+                'raw_mb': raw_bytes / 2**20,
+                'storage': 'mapped' if self.shared else 'private',
+                'dtypes': ', '.join(f"{col}: {dtype}" for col, dtype in df.dtypes.astype(str).items())
+            })
+        return pd.DataFrame(report)
+
+    # Hands out a shallow view of the cached table: data is shared (and read-only, see freeze),
+    # but columns added by a page (e.g. VOLUME, PURCHASE_HOUR) stay local to that view and never
+    # leak into the cache
     def get_df(self, name):
-        return self.dataframes[name]
-    
+        if name in self.derived_tables:
+            return self.load_derived(name).copy(deep=False)
+        return self.dataframes[name].copy(deep=False)
+
+    # Identifies the exact table versions this processor holds
+    def data_version(self):
+        return tuple(sorted(self.versions.items()))
+
+    # Returns a process-wide shared object built by build(self), rebuilt only when the data changes
+    def get_resource(self, name, build):
+        key = (os.path.abspath(self.base_path), name)
+        version = self.data_version()
+        with _RESOURCE_CACHE_LOCK:
+            cached = _RESOURCE_CACHE.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            build_lock = _RESOURCE_BUILD_LOCKS.setdefault(key, threading.Lock())
+        with build_lock:
+            # Another thread may have built this version while we waited
+            with _RESOURCE_CACHE_LOCK:
+                cached = _RESOURCE_CACHE.get(key)
+            if cached is None or cached[0] != version:
+                with stage(f"build {name}"):
+                    cached = (version, build(self))
+                with _RESOURCE_CACHE_LOCK:
+                    _RESOURCE_CACHE[key] = cached
+        return cached[1]
+
+    # The dataset lives under data/partitions/<table>/ (PURCHASE_DATE=YYYY-MM-DD/ for purchases)
+    def partition_root(self, file):
+        return os.path.join(self.base_path, 'partitions', file)
+
+    def partition_files(self, file):
+        if file not in DATE_PARTITIONED:
+            return sorted(glob.glob(os.path.join(self.partition_root(file), '*.parquet')))
+        return sorted(glob.glob(os.path.join(self.partition_root(file), 'PURCHASE_DATE=*', '*.parquet')))
+
+    def derived_path(self, name=None):
+        path = os.path.join(self.base_path, 'derived')
+        if name is None:
+            return path
+        # The fact table is a directory of parts so ingested batches can be appended to it
+        if name == 'fact':
+            return os.path.join(path, name)
+        if name == 'popularity':
+            return os.path.join(path, 'popularity.npz')
+        return os.path.join(path, f"{name}.parquet")
+
+    # Identifies the current source data; derived tables are rebuilt whenever it changes
+    def source_fingerprint(self):
+        fingerprint = {}
+        for file in self.files:
+            fingerprint[file] = []
+            for path in self.partition_files(file):
+                stat = os.stat(path)
+                fingerprint[file].append([os.path.relpath(path, self.base_path), stat.st_mtime_ns, stat.st_size])
+        return fingerprint
+
+    @instrumented('DataProcessor.load_derived')
+    def load_derived(self, name):
+        self.materialize()
+        return self.read_cached(self.derived_path(name))[1]
+
+    # Streaming popularity statistics (sketches.py) kept next to the rollups. Derived tables
+    # materialized before they existed get them from the fact table on first use.
+    @instrumented('DataProcessor.load_popularity')
+    def load_popularity(self):
+        self.materialize()
+        path = self.derived_path('popularity')
+        if not os.path.exists(path):
+            fact = self.load_derived('fact')
+            with _MATERIALIZE_LOCK:
+                if not os.path.exists(path):
+                    PopularityStats().update(fact).save(path)
+        return PopularityStats.load(path)
+
+    def write_manifest(self, fingerprint):
+        manifest_path = os.path.join(self.derived_path(), 'manifest.json')
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump({'sources': fingerprint, 'tables': self.derived_tables}, f)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    # Builds the fact table and rollups once and persists them next to the raw data
+    @instrumented('DataProcessor.materialize')
+    def materialize(self, force=False):
+        manifest_path = os.path.join(self.derived_path(), 'manifest.json')
+        with _MATERIALIZE_LOCK:
+            fingerprint = self.source_fingerprint()
+            if not force and os.path.exists(manifest_path):
+                with open(manifest_path) as f:
+                    if json.load(f).get('sources') == fingerprint:
+                        return False
+
+            os.makedirs(self.derived_path(), exist_ok=True)
+            aggregates = self.build_aggregates(self.dataframes['purchase_header'], self.dataframes['purchase_lines'])
+            shutil.rmtree(self.derived_path('fact'), ignore_errors=True)
+            os.makedirs(self.derived_path('fact'))
+            fact = aggregates.pop('fact')
+            write_parquet_atomic(fact, os.path.join(self.derived_path('fact'), 'part-base.parquet'))
+            PopularityStats().update(fact).save(self.derived_path('popularity'))
+            for name, df in aggregates.items():
+                write_parquet_atomic(df, self.derived_path(name))
+
+            # Manifest is written last so a crash mid-build forces a rebuild next time
+            self.write_manifest(fingerprint)
+            return True
+
+    def build_aggregates(self, purchase_header_df, purchase_lines_df):
+        header = purchase_header_df[['PURCHASE_ID', 'PURCHASE_DATE_TIME']]
+        header = header.assign(
+            PURCHASE_DATE=header['PURCHASE_DATE_TIME'].dt.normalize(),
+            PURCHASE_HOUR=header['PURCHASE_DATE_TIME'].dt.hour
+        )
+
+        # purchase_lines ⋈ product ⋈ purchase_header, done once instead of on every render
+        fact = purchase_lines_df.merge(self.dataframes['product'], on='PRODUCT_ID') \
+            .merge(header, on='PURCHASE_ID')
+
+        daily = fact.groupby('PURCHASE_DATE').agg(
+            QUANTITY=('QUANTITY', 'sum'), LINE_COUNT=('PURCHASE_ID', 'size')).reset_index()
+        purchases_per_day = header.groupby('PURCHASE_DATE').size().reset_index(name='PURCHASE_COUNT')
+        daily = daily.merge(purchases_per_day, on='PURCHASE_DATE', how='outer').fillna(0)
+
+        hourly = fact.groupby(['PURCHASE_HOUR', 'PRODUCT_ID']).size().reset_index(name='LINE_COUNT')
+
+        department_daily = fact.groupby(['DEPARTMENT_NAME', 'PURCHASE_DATE'], observed=True).agg(
+            QUANTITY=('QUANTITY', 'sum'), LINE_COUNT=('PURCHASE_ID', 'size')).reset_index()
+
+        product_daily = fact.groupby(['PURCHASE_DATE', 'PRODUCT_ID']).agg(
+            LINE_COUNT=('PURCHASE_ID', 'size'), QUANTITY=('QUANTITY', 'sum')).reset_index()
+
+        return {
+            'fact': fact,
+            'daily': daily,
+            'hourly': hourly,
+            'department_daily': department_daily,
+            'product_daily': product_daily
+        }
+
+    @staticmethod
+    def read_batch(source):
+        if isinstance(source, pd.DataFrame):
+            return source.copy()
+        if str(source).endswith('.csv'):
+            return pa.Table.from_batches(list(read_csv_batches(source))).to_pandas()
+        return pd.read_parquet(source)
+
+    # A batch in the stored table's schema: the required columns must be there, other columns of
+    # the table are kept (and filled with nulls when the batch lacks them), and columns the table
+    # doesn't have are rejected rather than silently dropped
+    def conform_batch(self, file, df):
+        missing = set(REQUIRED_COLUMNS[file]) - set(df.columns)
+        if missing:
+            raise ValueError(f"{file} batch is missing columns: {', '.join(sorted(missing))}")
+        columns = self.dataframes[file].columns
+        unknown = set(df.columns) - set(columns)
+        if unknown:
+            raise ValueError(f"{file} batch has columns the dataset doesn't: {', '.join(sorted(unknown))}")
+        return df.reindex(columns=columns)
+
+    # Appends a new purchase_header/purchase_lines extract without reloading the history: the
+    # batch is validated, de-duplicated, written as new date partitions, and folded into the
+    # materialized rollups. Cost scales with the batch, not the total history.
+    @instrumented('DataProcessor.ingest_batch')
+    def ingest_batch(self, header_source, lines_source):
+        header = self.conform_batch('purchase_header', self.normalize(self.read_batch(header_source)))
+        lines = self.conform_batch('purchase_lines', self.normalize(self.read_batch(lines_source)))
+
+        orphans = ~lines['PURCHASE_ID'].isin(header['PURCHASE_ID'])
+        if orphans.any():
+            raise ValueError(f"{orphans.sum()} purchase lines reference purchases missing from the header batch")
+        # The fact table joins lines to product, so lines of unknown products would be stored but
+        # missing from every rollup
+        unknown_products = ~lines['PRODUCT_ID'].isin(self.dataframes['product']['PRODUCT_ID'])
+        if unknown_products.any():
+            raise ValueError(f"{unknown_products.sum()} purchase lines reference products missing from product "
+                f"(e.g. {lines.loc[unknown_products, 'PRODUCT_ID'].iloc[0]})")
+
+        # Drop purchases repeated within the batch or already stored (e.g. a re-sent extract), and
+        # lines repeated within a purchase of the batch
+        from query_index import QueryIndex
+        index = self.get_resource('query_index', QueryIndex.from_processor)
+        received, received_lines = len(header), len(lines)
+        header = header.drop_duplicates('PURCHASE_ID')
+        header = header[index.purchase_header_rows(header['PURCHASE_ID'].to_numpy()) < 0]
+        lines = lines[lines['PURCHASE_ID'].isin(header['PURCHASE_ID'])]
+        lines = lines.drop_duplicates(['PURCHASE_ID', 'PRODUCT_ID'])
+        summary = {'purchases': len(header), 'lines': len(lines), 'skipped_purchases': received - len(header),
+            'skipped_lines': received_lines - len(lines)}
+        if header.empty:
+            return summary
+
+        # Derived tables must be current before the batch is folded into them
+        self.materialize()
+        # Unique even for batches ingested within the same second, which would overwrite each other
+        batch_id = time.strftime('%Y%m%d%H%M%S') + f"-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        purchase_dates = header.set_index('PURCHASE_ID')['PURCHASE_DATE_TIME'].dt.strftime('%Y-%m-%d')
+        with _MATERIALIZE_LOCK:
+            for file, df in [('purchase_header', header), ('purchase_lines', lines)]:
+                self.write_partitions(file, df, purchase_dates, f"batch-{batch_id}")
+                for date in purchase_dates.unique():
+                    partition = os.path.join(self.partition_root(file), f"PURCHASE_DATE={date}")
+                    compact_parts(partition, os.path.join(partition, f"batch-{batch_id}.parquet"))
+
+            self.update_aggregates(header, lines, batch_id)
+            self.write_manifest(self.source_fingerprint())
+
+        self.dataframes = self.load_data()
+        return summary
 
+    # Folds a batch's rollups into the stored ones: each additive rollup is re-grouped on its
+    # keys (rollup-sized work), the batch's fact rows are appended as a new part and counted
+    # into the popularity sketches
+    def update_aggregates(self, purchase_header_df, purchase_lines_df, batch_id):
+        batch = self.build_aggregates(purchase_header_df, purchase_lines_df)
+        fact = batch.pop('fact')
+        write_parquet_atomic(fact, os.path.join(self.derived_path('fact'), f"part-{batch_id}.parquet"))
+        compact_parts(self.derived_path('fact'), os.path.join(self.derived_path('fact'), f"part-{batch_id}.parquet"))
+        if os.path.exists(self.derived_path('popularity')):
+            PopularityStats.load(self.derived_path('popularity')).update(fact).save(self.derived_path('popularity'))
+        for name, df in batch.items():
+            existing = self.read_cached(self.derived_path(name))[1]
+            combined = pd.concat([existing, df], ignore_index=True)
+            combined = combined.groupby(ROLLUP_KEYS[name], observed=True).sum().reset_index()
+            write_parquet_atomic(combined, self.derived_path(name))
 
+    @staticmethod
+    def clear_cache():
+        with _TABLE_CACHE_LOCK:
+            _TABLE_CACHE.clear()
+        with _RESOURCE_CACHE_LOCK:
+            _RESOURCE_CACHE.clear()
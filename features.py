@@ -0,0 +1,137 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from model_registry import data_fingerprint
+
+# Features of the original models, and the full set produced by the panel pipeline
+FEATURES = ['day_of_week', 'month', 'year', 'lag_1', 'lag_2', 'rolling_mean_7']
+PANEL_FEATURES = FEATURES + ['rolling_std_7', 'ewm_7']
+
+# Feature frames shared across sessions, keyed by a fingerprint of the input data
+_FEATURE_CACHE = OrderedDict()
+_FEATURE_CACHE_LOCK = threading.Lock()
+
+# Feature columns a fitted model expects, falling back to the original six
+def model_features(model):
+    names = getattr(model, 'feature_names_in_', None)
+    if names is None:
+        names = getattr(model, 'feature_names_', None)
+    return list(names) if names is not None and len(names) else list(FEATURES)
+
+class FeaturePipeline:
+    # Builds a dense product x day panel of purchase counts (zero on days without sales) and
+    # derives every lag/rolling feature from it with vectorized kernels. Features for day t only
+    # use days before t, and the rolling windows never cross from one product into another.
+    def __init__(self, window=7, cache_size=2):
+        self.window = window
+        self.alpha = 2 / (window + 1)
+        self.cache_size = cache_size
+
+    def build_panel(self, data):
+        dates = pd.to_datetime(data['PURCHASE_DATE'])
+        product_codes, product_ids = pd.factorize(data['PRODUCT_ID'], sort=True)
+        all_dates = pd.date_range(dates.min(), dates.max(), freq='D')
+        day_codes = ((dates - all_dates[0]) // pd.Timedelta(days=1)).to_numpy()
+
+        counts = np.zeros((len(product_ids), len(all_dates)), dtype=np.float64)
+        np.add.at(counts, (product_codes, day_codes), data['PURCHASE_COUNT'].to_numpy(dtype=np.float64))
+        return np.asarray(product_ids), all_dates, counts
+
+    # Past-only features for every (product, day) cell of the panel
+    def panel_features(self, counts):
+        n_products, n_days = counts.shape
+        w = self.window
+        padded = np.concatenate([np.zeros((n_products, w)), counts], axis=1)
+
+        # Rolling sums over the w days before each day from cumulative sums of x and x^2
+        csum = np.concatenate([np.zeros((n_products, 1)), np.cumsum(padded, axis=1)], axis=1)
+        csum_sq = np.concatenate([np.zeros((n_products, 1)), np.cumsum(padded ** 2, axis=1)], axis=1)
+        ends = np.arange(w, w + n_days)
+        window_sum = csum[:, ends] - csum[:, ends - w]
+        window_sum_sq = csum_sq[:, ends] - csum_sq[:, ends - w]
+        rolling_mean = window_sum / w
+        rolling_var = np.maximum(window_sum_sq - window_sum ** 2 / w, 0) / (w - 1)
+
+        # Exponentially weighted mean of past days, one vectorized update per day
+        ewm = np.zeros((n_products, n_days))
+        for t in range(1, n_days):
+            ewm[:, t] = self.alpha * counts[:, t - 1] + (1 - self.alpha) * ewm[:, t - 1]
+
+        return {
+            'lag_1': padded[:, w - 1:w - 1 + n_days],
+            'lag_2': padded[:, w - 2:w - 2 + n_days],
+            'rolling_mean_7': rolling_mean,
+            'rolling_std_7': np.sqrt(rolling_var),
+            'ewm_7': ewm
+        }
+
+    # Long (product, day) feature frame for days with a full window of history; cached
+    def feature_frame(self, data):
+        key = data_fingerprint(data[['PURCHASE_DATE', 'PRODUCT_ID', 'PURCHASE_COUNT']])
+        with _FEATURE_CACHE_LOCK:
+            if key in _FEATURE_CACHE:
+                _FEATURE_CACHE.move_to_end(key)
+                return _FEATURE_CACHE[key]
+
+        product_ids, dates, counts = self.build_panel(data)
+        features = self.panel_features(counts)
+        days = slice(self.window, len(dates))
+        n_products, n_rows = len(product_ids), len(dates) - self.window
+        row_dates = dates[days]
+
+        frame = pd.DataFrame({
+            'PRODUCT_ID': np.repeat(product_ids, max(n_rows, 0)),
+            'PURCHASE_DATE': np.tile(row_dates, n_products),
+            'PURCHASE_COUNT': counts[:, days].ravel().astype(np.float32),
+            'day_of_week': np.tile(row_dates.dayofweek, n_products),
+            'month': np.tile(row_dates.month, n_products),
+            'year': np.tile(row_dates.year, n_products),
+            **{name: values[:, days].ravel().astype(np.float32) for name, values in features.items()}
+        })
+
+        with _FEATURE_CACHE_LOCK:
+            _FEATURE_CACHE[key] = frame
+            while len(_FEATURE_CACHE) > self.cache_size:
+                _FEATURE_CACHE.popitem(last=False)
+        return frame
+
+    # State for recursive forecasting: the last `window` panel values per product and the
+    # exponentially weighted mean as of the day after the panel ends
+    def initial_state(self, data, product_ids):
+        panel_ids, _, counts = self.build_panel(data)
+        rows = pd.Index(panel_ids).get_indexer(product_ids)
+        known = rows >= 0
+
+        padded = np.concatenate([np.zeros((counts.shape[0], self.window)), counts], axis=1)
+        ewm = np.zeros(counts.shape[0])
+        for t in range(counts.shape[1]):
+            ewm = self.alpha * counts[:, t] + (1 - self.alpha) * ewm
+
+        values = np.zeros((len(product_ids), self.window))
+        ewm_state = np.zeros(len(product_ids))
+        values[known] = padded[rows[known], -self.window:]
+        ewm_state[known] = ewm[rows[known]]
+        return values, ewm_state
+
+    # Features for one forecast step from the recursive state; same definitions as panel_features.
+    # A float32 (products x features) matrix with columns in `features` order, for a Predictor.
+    def step_features(self, values, ewm, date, features):
+        n_products = len(values)
+        columns = {
+            'day_of_week': np.full(n_products, date.dayofweek),
+            'month': np.full(n_products, date.month),
+            'year': np.full(n_products, date.year),
+            'lag_1': values[:, -1],
+            'lag_2': values[:, -2],
+            'rolling_mean_7': values.mean(axis=1),
+            'rolling_std_7': values.std(axis=1, ddof=1),
+            'ewm_7': ewm
+        }
+        return np.column_stack([columns[feature] for feature in features]).astype(np.float32)
+
+    # Advances the state by one step once a prediction is known
+    def update_state(self, values, ewm, predictions):
+        values = np.roll(values, -1, axis=1)
+        values[:, -1] = predictions
+        return values, self.alpha * predictions + (1 - self.alpha) * ewm
@@ -0,0 +1,254 @@
+import os
+import time
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from forecasting import BatchForecaster, FORECAST_COLUMNS
+from model_registry import ModelRegistry
+from predictors import Predictor
+from instrumentation import instrumented
+
+# Per process index of the stored forecasts, rebuilt when the files change
+_INDEX_CACHE = {}
+_INDEX_CACHE_LOCK = threading.Lock()
+
+# Forecasting months of recursive state for one chunk of products, in a worker process. Each
+# worker loads the model once through its own registry cache.
+def forecast_chunk(model_dir, model_name, values, ewm, future_dates, pipeline):
+    registry = ModelRegistry(model_dir)
+    predictor = Predictor.for_model(registry.load(model_name), registry.describe(model_name).get('features'))
+    return BatchForecaster({}, pipeline).predict_steps(predictor, values, ewm, future_dates)
+
+class ForecastStore:
+    # Precomputed monthly forecasts of every product with history and every trained model, stored
+    # next to the models as one columnar table keyed by (MODEL, PRODUCT_ID, PURCHASE_DATE). A
+    # state table records, per model and product, a hash of the recursive state (recent daily
+    # counts and EWM) the forecast started from, plus the model artifact, data and horizon. A
+    # forecast depends on nothing else, so a refresh skips the products whose hash is unchanged,
+    # and a lookup is only served for the model version and data it was computed on. The state
+    # ends on the last day of the data, so data that adds a new day shifts every product's state
+    # and recomputes them all; only purchases added to days already covered (late batches, fixes
+    # to one product) recompute just the products they touch.
+    def __init__(self, model_dir='models'):
+        self.model_dir = model_dir
+        self.path = os.path.join(model_dir, 'forecasts.parquet')
+        self.state_path = os.path.join(model_dir, 'forecast_state.parquet')
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=FORECAST_COLUMNS)
+        return pd.read_parquet(self.path)
+
+    def read_state(self):
+        if not os.path.exists(self.state_path):
+            return pd.DataFrame(columns=['MODEL', 'PRODUCT_ID', 'STATE_HASH', 'MODEL_SHA256', 'DATA_FINGERPRINT', 'START', 'END'])
+        return pd.read_parquet(self.state_path)
+
+    # {model: (product IDs, forecast dates, products x dates predictions, model hash, data
+    # fingerprint)}, shared by every lookup in the process
+    def index(self):
+        try:
+            version = (os.stat(self.path).st_mtime_ns, os.stat(self.state_path).st_mtime_ns)
+        except FileNotFoundError:
+            return {}
+        key = os.path.abspath(self.path)
+        with _INDEX_CACHE_LOCK:
+            cached = _INDEX_CACHE.get(key)
+            if cached is None or cached[0] != version:
+                cached = (version, self.build_index())
+                _INDEX_CACHE[key] = cached
+        return cached[1]
+
+    def build_index(self):
+        forecasts = self.read().sort_values(['MODEL', 'PRODUCT_ID', 'PURCHASE_DATE'])
+        state = self.read_state().drop_duplicates('MODEL').set_index('MODEL')
+        index = {}
+        for model_name, rows in forecasts.groupby('MODEL', observed=True, sort=False):
+            product_ids = rows['PRODUCT_ID'].unique()
+            dates = pd.DatetimeIndex(rows['PURCHASE_DATE'].unique())
+            predictions = rows['PREDICTED_PURCHASE_COUNT'].to_numpy().reshape(len(product_ids), len(dates))
+            index[model_name] = (product_ids, dates, predictions, state.loc[model_name, 'MODEL_SHA256'], state.loc[model_name, 'DATA_FINGERPRINT'])
+        return index
+
+    # Stored entry of a model when it was computed with that artifact and data, and the number of
+    # its forecast months covering start..end. A recursive forecast depends on where it starts,
+    # so only horizons starting on the stored first month are served.
+    def entry(self, model_name, start_date, end_date, model_sha256=None, data_version=None):
+        entry = self.index().get(model_name)
+        if entry is None or (model_sha256 is not None and entry[3] != model_sha256) or (data_version is not None and entry[4] != data_version):
+            return None, 0
+        # Same months as pd.date_range(start_date, end_date, freq='MS'), without building it
+        start_date, end_date, first = pd.Timestamp(start_date), pd.Timestamp(end_date), entry[1][0]
+        first_month = start_date.year * 12 + start_date.month - (start_date.day == 1 and start_date == start_date.normalize())
+        steps = end_date.year * 12 + end_date.month - first_month
+        if steps <= 0 or steps > len(entry[1]) or first_month != first.year * 12 + first.month - 1:
+            return None, 0
+        return entry, steps
+
+    # (forecast dates, predictions) of one product as arrays, or None when not stored
+    def predictions(self, model_name, product_id, start_date, end_date, model_sha256=None, data_version=None):
+        entry, steps = self.entry(model_name, start_date, end_date, model_sha256, data_version)
+        if entry is None:
+            return None
+        row = np.searchsorted(entry[0], product_id)
+        if row == len(entry[0]) or entry[0][row] != product_id:
+            return None
+        return entry[1][:steps], entry[2][row, :steps]
+
+    # PURCHASE_DATE, PREDICTED_PURCHASE_COUNT of one product, or None when not stored
+    def lookup(self, model_name, product_id, start_date, end_date, model_sha256=None, data_version=None):
+        stored = self.predictions(model_name, product_id, start_date, end_date, model_sha256, data_version)
+        if stored is None:
+            return None
+        return pd.DataFrame({'PURCHASE_DATE': stored[0], 'PREDICTED_PURCHASE_COUNT': stored[1]})
+
+    # Many products and models in BatchForecaster.forecast's layout, or None unless all stored.
+    # model_hashes maps each model to the artifact hash its forecasts must have been computed with.
+    def lookup_many(self, model_names, product_ids, start_date, end_date, model_hashes, data_version=None):
+        product_ids = pd.unique(np.asarray(product_ids))
+        if len(product_ids) == 0:
+            return None
+        results = []
+        for model_name in model_names:
+            entry, steps = self.entry(model_name, start_date, end_date, model_hashes[model_name], data_version)
+            if entry is None:
+                return None
+            rows = np.minimum(np.searchsorted(entry[0], product_ids), len(entry[0]) - 1)
+            if (entry[0][rows] != product_ids).any():
+                return None
+            results.append(pd.DataFrame({
+                'MODEL': model_name,
+                'PRODUCT_ID': np.tile(product_ids, steps),
+                'PURCHASE_DATE': np.repeat(entry[1][:steps], len(product_ids)),
+                'PREDICTED_PURCHASE_COUNT': entry[2][rows, :steps].T.ravel()
+            }))
+        return pd.concat(results, ignore_index=True) if results else None
+
+    # Recomputes the stored forecasts of model_names (all trained models by default) over
+    # start_date..end_date (default: the 18 months after today). Products whose recursive state
+    # is unchanged keep their stored forecast unless the model artifact or horizon changed (or
+    # full); after data that adds a new day, that is none of them.
+    # Chunks of products are forecast in `workers` processes. Returns a summary per model.
+    @instrumented('ForecastStore.refresh')
+    def refresh(self, model_trainer, model_names=None, start_date=None, end_date=None, workers=None, chunk_size=5000, full=False):
+        start_date = pd.Timestamp(start_date) if start_date is not None else pd.Timestamp.today().normalize()
+        end_date = pd.Timestamp(end_date) if end_date is not None else start_date + pd.DateOffset(months=18)
+        future_dates = pd.date_range(start=start_date, end=end_date, freq='MS')
+        if len(future_dates) == 0:
+            raise ValueError(f"No forecast months between {start_date.date()} and {end_date.date()}")
+
+        pipeline = model_trainer.feature_pipeline
+        product_ids = np.sort(model_trainer.data['PRODUCT_ID'].unique())
+        values, ewm = pipeline.initial_state(model_trainer.data, product_ids)
+        state_hashes = pd.util.hash_pandas_object(pd.DataFrame(np.column_stack([values, ewm])), index=False).to_numpy()
+        data_version = model_trainer.data_version()
+        stored_state, index = self.read_state(), self.index()
+
+        # Products to forecast again, per model
+        stale = {}
+        for model_name in model_names or model_trainer.trained_models():
+            model_hash = model_trainer.registry.describe(model_name)['sha256']
+            stored = stored_state[stored_state['MODEL'] == model_name]
+            entry = index.get(model_name)
+            if (full or entry is None or stored.empty or stored['MODEL_SHA256'].iloc[0] != model_hash
+                    or not entry[1].equals(future_dates)):
+                stale[model_name] = (model_hash, np.ones(len(product_ids), dtype=bool))
+                continue
+            positions = pd.Index(stored['PRODUCT_ID']).get_indexer(product_ids)
+            stored_hashes = stored['STATE_HASH'].to_numpy()[np.maximum(positions, 0)]
+            stale[model_name] = (model_hash, (positions < 0) | (stored_hashes != state_hashes))
+
+        tasks = [(model_name, rows[i:i + chunk_size]) for model_name, (_, changed) in stale.items()
+            for rows in [np.flatnonzero(changed)] for i in range(0, len(rows), chunk_size)]
+        workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(forecast_chunk, self.model_dir, model_name, values[rows], ewm[rows], future_dates, pipeline)
+                    for model_name, rows in tasks]
+                chunks = [future.result() for future in futures]
+        else:
+            chunks = [forecast_chunk(self.model_dir, model_name, values[rows], ewm[rows], future_dates, pipeline) for model_name, rows in tasks]
+
+        # Fresh products x months matrices: unchanged products keep their stored predictions
+        predictions = {}
+        for model_name, (_, changed) in stale.items():
+            matrix = np.empty((len(product_ids), len(future_dates)))
+            if not changed.all():
+                entry = index[model_name]
+                kept = np.flatnonzero(~changed)
+                matrix[kept] = entry[2][np.searchsorted(entry[0], product_ids[kept])]
+            predictions[model_name] = matrix
+        for (model_name, rows), chunk in zip(tasks, chunks):
+            predictions[model_name][rows] = chunk.T
+
+        forecasts = self.read()
+        forecasts = [forecasts[~forecasts['MODEL'].isin(list(stale))]] if not forecasts.empty else []
+        state = stored_state[~stored_state['MODEL'].isin(list(stale))]
+        state = [state] if not state.empty else []
+        for model_name, (model_hash, _) in stale.items():
+            forecasts.append(pd.DataFrame({
+                'MODEL': model_name,
+                'PRODUCT_ID': np.repeat(product_ids, len(future_dates)),
+                'PURCHASE_DATE': np.tile(future_dates, len(product_ids)),
+                'PREDICTED_PURCHASE_COUNT': predictions[model_name].ravel()
+            }))
+            state.append(pd.DataFrame({
+                'MODEL': model_name,
+                'PRODUCT_ID': product_ids,
+                'STATE_HASH': state_hashes,
+                'MODEL_SHA256': model_hash,
+                'DATA_FINGERPRINT': data_version,
+                'START': future_dates[0],
+                'END': future_dates[-1]
+            }))
+        # Forecasts first: if the state write never happens, the next run recomputes these products
+        self.write(pd.concat(forecasts, ignore_index=True).sort_values(['MODEL', 'PRODUCT_ID', 'PURCHASE_DATE']), self.path)
+        self.write(pd.concat(state, ignore_index=True), self.state_path)
+        return {model_name: {'products': len(product_ids), 'refreshed': int(changed.sum())} for model_name, (_, changed) in stale.items()}
+
+    @staticmethod
+    def write(df, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def clear_cache():
+        with _INDEX_CACHE_LOCK:
+            _INDEX_CACHE.clear()
+
+def main():
+    from data_processor import DataProcessor
+    from modeling import ForecastModels
+    parser = argparse.ArgumentParser(description="Precompute the forecasts of every product and trained model")
+    parser.add_argument('--models', nargs='+', help="Subset of models (default: all trained)")
+    parser.add_argument('--start', help="First day of the horizon (default: today); forecasts are monthly from the next month start")
+    parser.add_argument('--months', type=int, default=18, help="Length of the horizon")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Forecasting processes")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Products per forecasting task")
+    parser.add_argument('--full', action='store_true', help="Recompute every product, not only those whose recursive state changed")
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--model-dir', default='models')
+    args = parser.parse_args()
+
+    data_processor = DataProcessor(args.data_dir)
+    model_trainer = ForecastModels(data_processor.get_df('product'), data_processor.get_df('purchase_lines'),
+        data_processor.get_df('purchase_header'), data_processor)
+    model_trainer.registry = ModelRegistry(args.model_dir)
+    unknown = set(args.models or []) - set(model_trainer.trained_models())
+    if unknown:
+        parser.error(f"Models not trained: {', '.join(sorted(unknown))}")
+
+    start_date = pd.Timestamp(args.start) if args.start else pd.Timestamp.today().normalize()
+    start = time.time()
+    summary = ForecastStore(args.model_dir).refresh(model_trainer, args.models, start_date, start_date + pd.DateOffset(months=args.months),
+        args.workers, args.chunk_size, args.full)
+    for model_name, result in summary.items():
+        print(f"{model_name:<28}{result['refreshed']:>8} of {result['products']} products refreshed")
+    print(f"Done in {time.time() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
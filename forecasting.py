@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from features import FeaturePipeline
+from predictors import Predictor
+
+FORECAST_COLUMNS = ['MODEL', 'PRODUCT_ID', 'PURCHASE_DATE', 'PREDICTED_PURCHASE_COUNT']
+
+# Purchases per product and day (PURCHASE_DATE, PRODUCT_ID, PURCHASE_COUNT), the series every
+# model is trained on and forecasts from, read from the materialized product x day rollup
+def daily_purchase_counts(data_processor):
+    product_daily = data_processor.get_df('product_daily')
+    return product_daily[['PURCHASE_DATE', 'PRODUCT_ID', 'LINE_COUNT']].rename(columns={'LINE_COUNT': 'PURCHASE_COUNT'})
+
+class BatchForecaster:
+    # Recursive multi-horizon forecasts for many products and models at once. Each product's
+    # recent history lives in a (products x window) NumPy array, and every horizon step is a
+    # single predict call per model across all products, through the model's Predictor adapter on
+    # a float32 matrix. Lag state and feature definitions come from the same FeaturePipeline used
+    # to build the training data. models maps names to fitted models or Predictors.
+    def __init__(self, models, pipeline=None):
+        self.models = models
+        self.pipeline = pipeline or FeaturePipeline()
+
+    def forecast(self, data, product_ids, start_date, end_date):
+        product_ids = pd.unique(np.asarray(product_ids))
+        future_dates = pd.date_range(start=start_date, end=end_date, freq='MS')
+        if len(product_ids) == 0 or len(future_dates) == 0:
+            return pd.DataFrame(columns=FORECAST_COLUMNS)
+        initial_values, initial_ewm = self.pipeline.initial_state(data, product_ids)
+
+        results = []
+        for model_name, model in self.models.items():
+            predictions = self.predict_steps(model, initial_values, initial_ewm, future_dates)
+            results.append(pd.DataFrame({
+                'MODEL': model_name,
+                'PRODUCT_ID': np.tile(product_ids, len(future_dates)),
+                'PURCHASE_DATE': np.repeat(future_dates, len(product_ids)),
+                'PREDICTED_PURCHASE_COUNT': predictions.ravel()
+            }))
+
+        if not results:
+            return pd.DataFrame(columns=FORECAST_COLUMNS)
+        return pd.concat(results, ignore_index=True)
+
+    # (steps x products) predictions of one model, recursively from the products' initial state
+    def predict_steps(self, model, initial_values, initial_ewm, future_dates):
+        predictor = model if isinstance(model, Predictor) else Predictor.for_model(model)
+        values, ewm = initial_values.copy(), initial_ewm.copy()
+        predictions = np.empty((len(future_dates), len(initial_values)))
+
+        for step, future_date in enumerate(future_dates):
+            predictions[step] = predictor.predict(self.pipeline.step_features(values, ewm, future_date, predictor.features))
+            # Feed the predictions back in as the newest history value
+            values, ewm = self.pipeline.update_state(values, ewm, predictions[step])
+        return predictions
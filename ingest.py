@@ -0,0 +1,17 @@
+import argparse
+from data_processor import DataProcessor
+
+# Appends one purchase extract (CSV or parquet) to the data store, e.g. from an hourly cron job
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a new purchase_header/purchase_lines batch")
+    parser.add_argument('header', help="purchase_header batch (.csv or .parquet)")
+    parser.add_argument('lines', help="purchase_lines batch (.csv or .parquet)")
+    parser.add_argument('--data-dir', default='data', help="Data directory to append to")
+    args = parser.parse_args()
+
+    summary = DataProcessor(args.data_dir).ingest_batch(args.header, args.lines)
+    print(f"Ingested {summary['purchases']} purchases ({summary['lines']} lines), "
+        f"skipped {summary['skipped_purchases']} duplicate purchases and {summary['skipped_lines']} duplicate lines")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import uuid
+import logging
+import functools
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+import pandas as pd
+
+# Per-stage instrumentation: wall time, CPU time, peak traced memory and output rows of each
+# instrumented call, grouped by run (one Streamlit rerun, one API request, one CLI invocation).
+# Each Streamlit session reruns in its own thread, so the current run is thread-local. Finished
+# stages are kept in a bounded process-wide log and, when DIAGNOSTICS_LOG is set, appended to
+# that file as JSON lines.
+
+STAGE_LOG = deque(maxlen=5000)
+_STAGE_LOG_LOCK = threading.Lock()
+_LOCAL = threading.local()
+
+logger = logging.getLogger('diagnostics')
+if os.environ.get('DIAGNOSTICS_LOG') and not logger.handlers:
+    _handler = logging.FileHandler(os.environ['DIAGNOSTICS_LOG'])
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# Memory tracing slows allocation-heavy code, so it is off unless the process asks for it
+# (DIAGNOSTICS_MEMORY=1, or a CLI calling enable_memory_tracing). tracemalloc is process-wide, so
+# it is a process setting rather than something one session could switch off under another.
+# Peaks are process-wide too: concurrent sessions allocating at once inflate each other's numbers.
+def enable_memory_tracing(enabled=True):
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def memory_tracing_enabled():
+    return tracemalloc.is_tracing()
+
+if os.environ.get('DIAGNOSTICS_MEMORY', '0') == '1':
+    enable_memory_tracing()
+
+def start_run(label=None):
+    _LOCAL.run_id = uuid.uuid4().hex[:12]
+    _LOCAL.label = label
+    # Bounded, since threads that never start a new run (API workers, CLIs) keep appending
+    _LOCAL.records = deque(maxlen=1000)
+    _LOCAL.stack = []
+    return _LOCAL.run_id
+
+# Stages recorded so far in this thread's current run
+def current_run():
+    return list(getattr(_LOCAL, 'records', []))
+
+def recent_stages():
+    with _STAGE_LOG_LOCK:
+        return list(STAGE_LOG)
+
+def row_count(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, tuple):
+        counts = [row_count(item) for item in value]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    return None
+
+# Times the enclosed block; set record['rows'] inside it to report how many rows it produced
+@contextmanager
+def stage(name, rows=None):
+    if not hasattr(_LOCAL, 'records'):
+        start_run()
+    stack = _LOCAL.stack
+    record = {'run_id': _LOCAL.run_id, 'run': _LOCAL.label, 'stage': name, 'depth': len(stack), 'rows': rows}
+
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        # Fold the peak so far into the enclosing stage before resetting it for this one
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+    frame = {'start_memory': current if tracing else 0, 'peak': current if tracing else 0}
+    stack.append(frame)
+
+    started_at = time.time()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record['wall_ms'] = (time.perf_counter() - wall) * 1000
+        record['cpu_ms'] = (time.process_time() - cpu) * 1000
+        record['peak_mb'] = None
+        if tracing and tracemalloc.is_tracing():
+            frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            record['peak_mb'] = (frame['peak'] - frame['start_memory']) / 2**20
+        stack.pop()
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], frame['peak'])
+        record['started_at'] = started_at
+
+        _LOCAL.records.append(record)
+        with _STAGE_LOG_LOCK:
+            STAGE_LOG.append(record)
+        if logger.handlers:
+            logger.info(json.dumps(record, default=str))
+
+# Decorator form of stage(); rows are taken from the returned DataFrame(s) when there are any
+def instrumented(name=None):
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name) as record:
+                result = func(*args, **kwargs)
+                record['rows'] = row_count(result)
+                return result
+        return wrapper
+    return decorator
+
+# Stage records as a frame, e.g. for the diagnostics panel
+def stages_frame(records):
+    columns = ['stage', 'depth', 'wall_ms', 'cpu_ms', 'peak_mb', 'rows', 'run', 'run_id', 'started_at']
+    # Stages are recorded as they finish; ordering by start time puts parents before children
+    frame = pd.DataFrame(records, columns=columns).sort_values(['started_at', 'depth'], kind='stable').reset_index(drop=True)
+    frame['stage'] = ['  ' * depth + name for depth, name in zip(frame['depth'], frame['stage'])]
+    return frame
+
+# JSON lines export of recorded stages
+def export_jsonl(records):
+    return '\n'.join(json.dumps(record, default=str) for record in records) + '\n'
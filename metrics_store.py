@@ -0,0 +1,48 @@
+import os
+import time
+import threading
+import pandas as pd
+
+_METRICS_LOCK = threading.Lock()
+
+class MetricsStore:
+    # Small on-disk table of evaluation metrics, one row per (model, data fingerprint, model hash).
+    # A row is only valid for the exact data and artifact it was computed on, so any change to
+    # either one simply misses the store and triggers a fresh evaluation.
+    key_columns = ['MODEL', 'DATA_FINGERPRINT', 'MODEL_SHA256']
+
+    def __init__(self, path=os.path.join('models', 'metrics.parquet')):
+        self.path = path
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=self.key_columns)
+        return pd.read_parquet(self.path)
+
+    def get(self, model_name, data_fingerprint, model_hash):
+        table = self.read()
+        match = table[(table['MODEL'] == model_name) & (table['DATA_FINGERPRINT'] == data_fingerprint)
+            & (table['MODEL_SHA256'] == model_hash)]
+        if match.empty:
+            return None
+        row = match.iloc[-1].drop(self.key_columns + ['EVALUATED_AT'])
+        return row.dropna().to_dict()
+
+    def put(self, model_name, data_fingerprint, model_hash, metrics):
+        row = pd.DataFrame([{
+            'MODEL': model_name,
+            'DATA_FINGERPRINT': data_fingerprint,
+            'MODEL_SHA256': model_hash,
+            **{key: float(value) for key, value in metrics.items()},
+            'EVALUATED_AT': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }])
+        with _METRICS_LOCK:
+            # Only the latest evaluation per model is kept
+            table = self.read()
+            table = table[table['MODEL'] != model_name]
+            table = pd.concat([table, row], ignore_index=True) if not table.empty else row
+
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            table.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, self.path)
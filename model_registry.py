@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+import joblib
+import pandas as pd
+
+# Bounded LRU of deserialized models shared by every session in the process. Entries are keyed
+# by artifact path and mtime, so re-saving a model naturally invalidates its cached copy.
+_MODEL_CACHE = OrderedDict()
+_MODEL_CACHE_LOCK = threading.Lock()
+_FILE_HASHES = {}
+
+# Stable fingerprint of the data a model was trained or evaluated on
+def data_fingerprint(df):
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha256(hashes.tobytes()).hexdigest()[:16]
+
+# SHA-256 of an artifact, memoized by path, mtime and size so unchanged files are hashed once
+def file_hash(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _FILE_HASHES:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        _FILE_HASHES[key] = digest.hexdigest()
+    return _FILE_HASHES[key]
+
+class ModelRegistry:
+    def __init__(self, model_dir='models', cache_size=3, mmap_mode=None):
+        self.model_dir = model_dir
+        self.cache_size = cache_size
+        # mmap_mode='r' memory-maps the NumPy arrays inside joblib artifacts instead of copying them
+        self.mmap_mode = mmap_mode
+        self.metadata_path = os.path.join(model_dir, 'registry.json')
+
+    def path(self, model_name, version=None):
+        if version is None:
+            return os.path.join(self.model_dir, f'{model_name}.pkl')
+        return os.path.join(self.model_dir, 'versions', model_name, f'v{version}.pkl')
+
+    def exists(self, model_name):
+        return os.path.exists(self.path(model_name))
+
+    def available_models(self):
+        return sorted(f[:-len('.pkl')] for f in os.listdir(self.model_dir) if f.endswith('.pkl'))
+
+    def read_metadata(self):
+        if not os.path.exists(self.metadata_path):
+            return {}
+        with open(self.metadata_path) as f:
+            return json.load(f)
+
+    # Metadata for one artifact; models saved before the registry existed get a computed entry
+    def describe(self, model_name):
+        metadata = self.read_metadata().get(model_name)
+        if metadata is not None:
+            return metadata
+        path = self.path(model_name)
+        return {'version': 0, 'path': path, 'sha256': file_hash(path)}
+
+    # Deserializes a model on first use only; later calls are served from the shared LRU
+    def load(self, model_name, version=None):
+        path = self.path(model_name, version)
+        key = (os.path.abspath(path), os.path.getmtime(path))
+        with _MODEL_CACHE_LOCK:
+            if key in _MODEL_CACHE:
+                _MODEL_CACHE.move_to_end(key)
+                return _MODEL_CACHE[key]
+
+        model = joblib.load(path, mmap_mode=self.mmap_mode)
+        with _MODEL_CACHE_LOCK:
+            _MODEL_CACHE[key] = model
+            _MODEL_CACHE.move_to_end(key)
+            while len(_MODEL_CACHE) > self.cache_size:
+                _MODEL_CACHE.popitem(last=False)
+        return model
+
+    # Writes a new artifact version atomically, keeping the previous one under versions/
+    def save(self, model_name, model, features=None, training_fingerprint=None, metrics=None, max_training_rows=None):
+        os.makedirs(self.model_dir, exist_ok=True)
+        metadata = self.read_metadata()
+        path = self.path(model_name)
+        previous = metadata.get(model_name)
+        # An artifact saved before the registry existed is archived as v0; its hash is all that's known of it
+        if previous is None and os.path.exists(path):
+            previous = {'version': 0}
+        version = previous['version'] + 1 if previous else 1
+
+        archived = None
+        if previous and os.path.exists(path):
+            archived = {'version': previous['version'], 'path': self.path(model_name, previous['version']), 'sha256': file_hash(path)}
+            os.makedirs(os.path.dirname(archived['path']), exist_ok=True)
+            shutil.copy2(path, archived['path'])
+
+        tmp_path = path + '.tmp'
+        joblib.dump(model, tmp_path)
+        os.replace(tmp_path, path)
+
+        if features is None and hasattr(model, 'feature_names_in_'):
+            features = list(model.feature_names_in_)
+        metadata[model_name] = {
+            'version': version,
+            'path': path,
+            'sha256': file_hash(path),
+            'features': list(features) if features is not None else None,
+            'training_fingerprint': training_fingerprint,
+            'max_training_rows': max_training_rows,
+            'metrics': metrics,
+            'previous': archived,
+            'saved_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        self.write_metadata(metadata)
+        return metadata[model_name]
+
+    def write_metadata(self, metadata):
+        tmp_path = self.metadata_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(metadata, f, indent=2, default=float)
+        os.replace(tmp_path, self.metadata_path)
+
+    @staticmethod
+    def clear_cache():
+        with _MODEL_CACHE_LOCK:
+            _MODEL_CACHE.clear()
@@ -0,0 +1,194 @@
+import os
+import importlib
+import pandas as pd
+import numpy as np
+from co_purchase import CoPurchaseEngine
+from forecasting import BatchForecaster, daily_purchase_counts
+from features import FeaturePipeline, PANEL_FEATURES, model_features
+from model_registry import ModelRegistry, data_fingerprint
+from metrics_store import MetricsStore
+from forecast_store import ForecastStore
+from predictors import Predictor
+from instrumentation import instrumented
+
+# Estimators by name as (module, class, parameters). A library is imported only when one of its
+# models is built, so importing this module never pays for sklearn, xgboost or catboost.
+MODEL_SPECS = {
+    'Random Forest': ('sklearn.ensemble', 'RandomForestRegressor', {'n_estimators': 100, 'random_state': 42}),
+    'Linear Regression': ('sklearn.linear_model', 'LinearRegression', {}),
+    'Decision Tree': ('sklearn.tree', 'DecisionTreeRegressor', {'random_state': 42}),
+    'Ridge Regression': ('sklearn.linear_model', 'Ridge', {}),
+    'Lasso Regression': ('sklearn.linear_model', 'Lasso', {}),
+    'Support Vector Regression': ('sklearn.svm', 'SVR', {}),
+    'XGBoost': ('xgboost', 'XGBRegressor', {'random_state': 42}),
+    'CatBoost': ('catboost', 'CatBoostRegressor', {'random_state': 42, 'verbose': 0})
+}
+
+# Kernel models, whose fit time grows quadratically or worse with the number of training rows.
+# They are fitted, and their train metrics computed, on a random sample of the training split of
+# at most KERNEL_ROWS rows (train.py --kernel-rows).
+KERNEL_MODELS = ['Support Vector Regression']
+KERNEL_ROWS = 10_000
+
+# The training rows a model is fitted on: a fixed random sample of at most max_rows for kernel
+# models, all of them otherwise. Most rows of the dense panel are quiet days with a zero history,
+# so a sample keeps their mix while bounding the fit time.
+def training_rows(model_name, X, y, max_rows=KERNEL_ROWS):
+    if model_name not in KERNEL_MODELS or not max_rows or len(X) <= max_rows:
+        return X, y
+    rows = np.sort(np.random.default_rng(42).choice(len(X), max_rows, replace=False))
+    return X.iloc[rows], y.iloc[rows]
+
+# Fresh, unfitted estimator for one of MODEL_SPECS
+def build_model(model_name):
+    module, class_name, params = MODEL_SPECS[model_name]
+    return getattr(importlib.import_module(module), class_name)(**params)
+
+# Data preparation, evaluation and forecasting for the purchase models, with no UI dependency.
+# ModelTrainer in model_page.py renders these results in Streamlit; train.py fits the models.
+class ForecastModels:
+    def __init__(self, product_df, purchase_lines_df, purchase_header_df, data_processor=None):
+        self.data_processor = data_processor
+        self.product_df = product_df
+        self.purchase_lines_df = purchase_lines_df
+        # Midnight timestamps rather than Python date objects: 8 bytes a row instead of an object each
+        self.purchase_header_df = purchase_header_df.assign(
+            PURCHASE_DATE=purchase_header_df['PURCHASE_DATE_TIME'].dt.normalize()
+        )
+        self.data = self.prepare_data()
+
+        # Names of the models used; estimators are built on demand with build_model
+        self.model_names = list(MODEL_SPECS)
+        self.results = {}
+        self.feature_pipeline = FeaturePipeline()
+        self.registry = ModelRegistry('models')
+        self.metrics_store = MetricsStore(os.path.join('models', 'metrics.parquet'))
+        self.forecast_store = ForecastStore('models')
+        self.fingerprint = None
+
+        # Ensure the models directory exists
+        if not os.path.exists('models'):
+            os.makedirs('models')
+
+    # Combingn data and preparing to train model on 
+    @instrumented()
+    def prepare_data(self):
+        # Read the materialized product x day rollup instead of re-joining the raw tables
+        if self.data_processor is not None:
+            return daily_purchase_counts(self.data_processor)
+        return self.purchase_lines_df.merge(self.purchase_header_df, on='PURCHASE_ID') \
+            .merge(self.product_df, on='PRODUCT_ID') \
+            .groupby(['PURCHASE_DATE', 'PRODUCT_ID']).size().reset_index(name='PURCHASE_COUNT')
+
+
+    # Fingerprint of self.data, computed once per trainer
+    def data_version(self):
+        if self.fingerprint is None:
+            self.fingerprint = data_fingerprint(self.data)
+        return self.fingerprint
+
+    # Dense product x day features (lags, rolling mean/std, EWM) from the shared pipeline
+    @instrumented()
+    def create_features(self, df):
+        return self.feature_pipeline.feature_frame(df)
+
+    # Saves trained models along with their features, training data fingerprint and metrics
+    def save_model(self, model_name, model, training_fingerprint=None, metrics=None, max_training_rows=None):
+        return self.registry.save(model_name, model, model_features(model), training_fingerprint, metrics, max_training_rows)
+
+    # Lazily deserializes a model through the shared registry cache
+    def load_model(self, model_name):
+        return self.registry.load(model_name)
+
+    # Low-latency adapter for a trained model, checked against the features stored with it
+    def load_predictor(self, model_name):
+        return Predictor.for_model(self.load_model(model_name), self.registry.describe(model_name).get('features'))
+
+    @staticmethod
+    @instrumented('ForecastModels.evaluate_model')
+    def evaluate_model(model, X_train, y_train, X_test, y_test):
+        from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+        metrics = {}
+        features = model_features(model)
+        for split, X, y in [('train', X_train, y_train), ('test', X_test, y_test)]:
+            X = X[features]
+            y_pred = model.predict(X)
+            metrics[f'{split}_mae'] = mean_absolute_error(y, y_pred)
+            metrics[f'{split}_mse'] = mean_squared_error(y, y_pred)
+            metrics[f'{split}_r2'] = r2_score(y, y_pred)
+            metrics[f'{split}_accuracy'] = model.score(X, y) * 100
+        return metrics
+
+    # Evaluates the requested trained models (all by default). Metrics are read from the metrics
+    # store and recomputed only when the data or the model artifact has changed. Models are never
+    # fitted here; training happens offline through train.py, and a model with no artifact gets
+    # no results.
+    @instrumented()
+    def train_and_evaluate(self, model_names=None):
+        data_version = self.data_version()
+        splits = None
+
+        for model_name in model_names or self.model_names:
+            if not self.registry.exists(model_name):
+                continue
+            model_hash = self.registry.describe(model_name)['sha256']
+            metrics = self.metrics_store.get(model_name, data_version, model_hash)
+            if metrics is None:
+                splits = splits or self.train_test_splits()
+                # Train metrics over the rows train.py fitted the model on, as it records them
+                max_rows = self.registry.describe(model_name).get('max_training_rows', KERNEL_ROWS)
+                X_train, y_train = training_rows(model_name, splits[0], splits[1], max_rows)
+                metrics = self.evaluate_model(self.load_model(model_name), X_train, y_train, splits[2], splits[3])
+                self.metrics_store.put(model_name, data_version, model_hash, metrics)
+            self.results[model_name] = metrics
+
+    def require_trained(self, model_name):
+        if not self.registry.exists(model_name):
+            raise FileNotFoundError(f"No trained {model_name} model. Run `python train.py --models '{model_name}'` to train it.")
+
+    def trained_models(self):
+        return [model_name for model_name in self.model_names if self.registry.exists(model_name)]
+
+    # Chronological split as (X_train, y_train, X_test, y_test): the most recent dates are held
+    # out so the test set always lies in the future of the training set
+    @instrumented()
+    def train_test_splits(self, test_size=0.2):
+        purchase_data = self.create_features(self.data)
+        dates = np.sort(purchase_data['PURCHASE_DATE'].to_numpy())
+        cutoff = dates[min(int(len(dates) * (1 - test_size)), len(dates) - 1)]
+        train = purchase_data['PURCHASE_DATE'] < cutoff
+
+        X, y = purchase_data[PANEL_FEATURES], purchase_data['PURCHASE_COUNT']
+        return X[train], y[train], X[~train], y[~train]
+
+    @instrumented()
+    def get_purchase_forecast(self, model, df, product_id, start_date, end_date):
+        forecast = BatchForecaster({'selected': model}, self.feature_pipeline).forecast(df, [product_id], start_date, end_date)
+        forecast_df = forecast[['PURCHASE_DATE', 'PREDICTED_PURCHASE_COUNT']].reset_index(drop=True)
+        return forecast_df, self.department(product_id)
+
+    def department(self, product_id):
+        return self.product_df[self.product_df['PRODUCT_ID'] == product_id]['DEPARTMENT_NAME'].values[0]
+
+    # (forecast, department) of one product, read from the precomputed forecast table when it
+    # holds this model version, data and horizon (see forecast_store.py), computed otherwise
+    @instrumented()
+    def product_forecast(self, model_name, product_id, start_date, end_date):
+        self.require_trained(model_name)
+        forecast_df = self.forecast_store.lookup(model_name, product_id, start_date, end_date,
+            self.registry.describe(model_name)['sha256'], self.data_version())
+        if forecast_df is None:
+            return self.get_purchase_forecast(self.load_model(model_name), self.data, product_id, start_date, end_date)
+        return forecast_df, self.department(product_id)
+
+    # Recursive forecasts for many products and models at once (e.g. a nightly catalog run)
+    @instrumented()
+    def get_batch_forecast(self, models, product_ids, start_date, end_date):
+        return BatchForecaster(models, self.feature_pipeline).forecast(self.data, product_ids, start_date, end_date)
+
+    # Top k products sharing baskets with product_id, not global popularity
+    @instrumented()
+    def co_purchases(self, product_id, k=10, co_purchase=None):
+        if co_purchase is None:
+            co_purchase = CoPurchaseEngine(self.purchase_lines_df)
+        return co_purchase.top_k(product_id, k)
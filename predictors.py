@@ -0,0 +1,151 @@
+import time
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+from features import model_features
+
+# Prediction adapters for single rows and small batches (API requests, recursive forecasts).
+# Each takes a float32 ndarray whose columns follow `features` and calls its library's native
+# path, skipping the DataFrame construction and input validation of model.predict:
+#   XGBoost   Booster.inplace_predict on the array
+#   CatBoost  predict on the raw array, single-threaded
+#   sklearn   linear models as X @ coef_ + intercept_, trees and forests through tree_.predict
+# Any other estimator (e.g. SVR, which is bound by its kernel evaluations) uses model.predict.
+
+class Predictor:
+    def __init__(self, model, features=None):
+        self.model = model
+        self.features = model_features(model)
+        # Stored metadata must name the same columns, in the same order, as the fitted model
+        if features is not None and list(features) != self.features:
+            raise ValueError(f"Stored features {list(features)} don't match the model's {self.features}")
+
+    @staticmethod
+    def for_model(model, features=None):
+        module = type(model).__module__
+        if module.startswith('xgboost'):
+            return XGBoostPredictor(model, features)
+        if module.startswith('catboost'):
+            return CatBoostPredictor(model, features)
+        if module.startswith('sklearn.linear_model'):
+            return LinearPredictor(model, features)
+        if module.startswith('sklearn.tree'):
+            return TreePredictor(model, features)
+        if module.startswith('sklearn.ensemble._forest'):
+            return ForestPredictor(model, features)
+        return Predictor(model, features)
+
+    # Predictions for a (rows x features) matrix, as float64
+    def predict(self, X):
+        if X.ndim != 2 or X.shape[1] != len(self.features):
+            raise ValueError(f"Expected rows of {len(self.features)} features ({', '.join(self.features)}), got shape {X.shape}")
+        return self.native_predict(X)
+
+    def native_predict(self, X):
+        # The model was fitted on a DataFrame, so sklearn warns about the missing column names
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            return np.asarray(self.model.predict(X), dtype=np.float64)
+
+    # One feature row as a (1 x features) float32 matrix, from a sequence already in feature
+    # order or a mapping of feature name to value
+    def row(self, values):
+        if isinstance(values, dict):
+            missing = [feature for feature in self.features if feature not in values]
+            if missing:
+                raise ValueError(f"Missing features: {', '.join(missing)}")
+            values = [values[feature] for feature in self.features]
+        return np.asarray(values, dtype=np.float32).reshape(1, -1)
+
+    def predict_row(self, values):
+        return float(self.predict(self.row(values))[0])
+
+    def predict_frame(self, df):
+        return self.predict(df[self.features].to_numpy(dtype=np.float32))
+
+class XGBoostPredictor(Predictor):
+    def __init__(self, model, features=None):
+        super().__init__(model, features)
+        self.booster = model.get_booster()
+
+    def native_predict(self, X):
+        return np.asarray(self.booster.inplace_predict(X), dtype=np.float64)
+
+class CatBoostPredictor(Predictor):
+    def native_predict(self, X):
+        # Thread start-up costs more than it saves on a handful of rows
+        return np.asarray(self.model.predict(X, thread_count=1 if len(X) < 1000 else -1), dtype=np.float64)
+
+class LinearPredictor(Predictor):
+    def __init__(self, model, features=None):
+        super().__init__(model, features)
+        self.coef = np.asarray(model.coef_, dtype=np.float64).ravel()
+        self.intercept = float(np.ravel(model.intercept_)[0])
+
+    def native_predict(self, X):
+        return X @ self.coef + self.intercept
+
+class TreePredictor(Predictor):
+    def native_predict(self, X):
+        return self.model.tree_.predict(np.ascontiguousarray(X, dtype=np.float32))[:, 0].astype(np.float64)
+
+class ForestPredictor(Predictor):
+    def __init__(self, model, features=None):
+        super().__init__(model, features)
+        self.trees = [estimator.tree_ for estimator in model.estimators_]
+
+    def native_predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        total = np.zeros(len(X))
+        for tree in self.trees:
+            total += tree.predict(X)[:, 0]
+        return total / len(self.trees)
+
+# Single-row latency of model.predict on a DataFrame against the adapter, in microseconds
+def micro_benchmark(predictor, X, repeat=1000):
+    frame = pd.DataFrame(X[:1].astype(np.float64), columns=predictor.features)
+    row = X[:1]
+    timings = {}
+    for name, func in [('dataframe', lambda: predictor.model.predict(frame)), ('native', lambda: predictor.predict(row))]:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            func()
+            runs = np.empty(repeat)
+            for i in range(repeat):
+                start = time.perf_counter()
+                func()
+                runs[i] = time.perf_counter() - start
+        timings[f'{name}_p50_us'] = float(np.median(runs) * 1e6)
+        timings[f'{name}_p99_us'] = float(np.percentile(runs, 99) * 1e6)
+    # Adapters must agree with model.predict on the whole sample
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        expected = predictor.model.predict(pd.DataFrame(X.astype(np.float64), columns=predictor.features))
+    timings['max_abs_diff'] = float(np.max(np.abs(predictor.predict(X) - expected)))
+    return timings
+
+def main():
+    from data_processor import DataProcessor
+    from modeling import ForecastModels
+    parser = argparse.ArgumentParser(description="Single-row prediction latency of every trained model")
+    parser.add_argument('--models', nargs='+', help="Subset of models (default: all trained)")
+    parser.add_argument('--repeat', type=int, default=1000, help="Timed calls per model and path")
+    parser.add_argument('--rows', type=int, default=1000, help="Test rows used to check the adapters against model.predict")
+    args = parser.parse_args()
+
+    data_processor = DataProcessor()
+    model_trainer = ForecastModels(data_processor.get_df('product'), data_processor.get_df('purchase_lines'),
+        data_processor.get_df('purchase_header'), data_processor)
+    X_test = model_trainer.train_test_splits()[2]
+
+    print(f"{'model':<28}{'DataFrame p50':>15}{'native p50':>12}{'native p99':>12}{'speedup':>9}{'max diff':>10}")
+    for model_name in args.models or model_trainer.trained_models():
+        predictor = model_trainer.load_predictor(model_name)
+        X = X_test[predictor.features].sample(min(args.rows, len(X_test)), random_state=0).to_numpy(dtype=np.float32)
+        timings = micro_benchmark(predictor, X, args.repeat)
+        print(f"{model_name:<28}{timings['dataframe_p50_us']:>13.0f}us{timings['native_p50_us']:>10.0f}us"
+            f"{timings['native_p99_us']:>10.0f}us{timings['dataframe_p50_us'] / timings['native_p50_us']:>8.1f}x{timings['max_abs_diff']:>10.1e}")
+
+if __name__ == "__main__":
+    main()
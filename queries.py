@@ -0,0 +1,130 @@
+import re
+import numpy as np
+import pandas as pd
+from query_index import QueryIndex
+from co_purchase import CoPurchaseEngine
+from instrumentation import instrumented
+
+class PurchaseQueries:
+    # Purchase/product lookups as plain DataFrames, with no UI dependency; QueryTool renders them
+    # in Streamlit and api.py serves them as JSON
+    def __init__(self, product_df, purchase_lines_df, purchase_header_df, index=None, co_purchase=None, data_processor=None):
+        self.product_df = product_df
+        self.purchase_lines_df = purchase_lines_df
+        self.purchase_header_df = purchase_header_df
+        # Shared index built once per data version; fall back to indexing these frames directly
+        self.index = index if index is not None else QueryIndex(product_df, purchase_lines_df, purchase_header_df)
+        self.co_purchase = co_purchase
+        # When set, date queries read only the matching partitions instead of the in-memory tables
+        self.data_processor = data_processor
+        # Calculate the volume and add it to the product_df
+        self.product_df['VOLUME'] = self.product_df['HEIGHT_INCHES'] * self.product_df['WIDTH_INCHES'] * self.product_df['DEPTH_INCHES']
+
+    @classmethod
+    def from_processor(cls, data_processor):
+        return cls(data_processor.get_df('product'), data_processor.get_df('purchase_lines'), data_processor.get_df('purchase_header'),
+            data_processor.get_resource('query_index', QueryIndex.from_processor),
+            data_processor.get_resource('co_purchase', CoPurchaseEngine.from_processor), data_processor)
+
+    # IDs are stored as integers, so strip commas and convert the raw text input
+    @staticmethod
+    def parse_id(text):
+        try:
+            return int(str(text).replace(',', '').strip())
+        except ValueError:
+            return None
+
+    # Many IDs pasted or uploaded at once: one per line or separated by spaces, tabs or semicolons
+    # (commas are kept as thousands separators). Returns (valid IDs in order, unparseable tokens).
+    @staticmethod
+    def parse_ids(text):
+        ids, invalid = [], []
+        for token in re.split(r'[\s;]+', str(text)):
+            if token:
+                parsed = PurchaseQueries.parse_id(token)
+                (invalid if parsed is None else ids).append(token if parsed is None else parsed)
+        return list(dict.fromkeys(ids)), invalid
+
+    # Joins product details onto a small set of lines, only touching the products they reference
+    def merge_product_details(self, lines_df):
+        products = self.product_df.iloc[self.index.product_rows(lines_df['PRODUCT_ID'].unique())]
+        return lines_df.merge(products, on='PRODUCT_ID')
+
+    # (purchase date, lines with product details) of one purchase; raises IndexError if unknown
+    @instrumented()
+    def purchase(self, purchase_id):
+        header_rows = self.index.purchase_header_rows(purchase_id)
+        purchase_date = self.purchase_header_df['PURCHASE_DATE_TIME'].iloc[header_rows[header_rows >= 0]].iloc[0]
+        purchase_lines = self.purchase_lines_df.iloc[self.index.purchase_line_rows(purchase_id)]
+        return purchase_date, self.merge_product_details(purchase_lines).drop(columns=['PURCHASE_ID'])
+
+    @instrumented()
+    def product(self, product_id):
+        return self.product_df.iloc[self.index.product_rows(product_id)]
+
+    # PURCHASE_ID, PURCHASE_DATE_TIME, QUANTITY of every line of one product
+    @instrumented()
+    def product_purchases(self, product_id):
+        product_purchase_lines = self.purchase_lines_df.iloc[self.index.product_line_rows(product_id)]
+
+        # Resolve every line's purchase date with one vectorized header lookup
+        header_rows = self.index.purchase_header_rows(product_purchase_lines['PURCHASE_ID'].to_numpy())
+        product_purchase_lines = product_purchase_lines[header_rows >= 0]
+        header_rows = header_rows[header_rows >= 0]
+        return pd.DataFrame({
+            'PURCHASE_ID': product_purchase_lines['PURCHASE_ID'].to_numpy(),
+            'PURCHASE_DATE_TIME': self.purchase_header_df['PURCHASE_DATE_TIME'].to_numpy()[header_rows],
+            'QUANTITY': product_purchase_lines['QUANTITY'].to_numpy()
+        })
+
+    @instrumented()
+    def top_co_purchases(self, product_id, k=5, by='CO_PURCHASE_COUNT'):
+        if self.co_purchase is None:
+            self.co_purchase = CoPurchaseEngine(self.purchase_lines_df)
+        return self.co_purchase.top_k(product_id, k, by)
+
+    # Header and lines of one day's purchases; lines are partitioned by their purchase's date,
+    # so a scan of that single partition returns exactly the lines of those purchases
+    @instrumented()
+    def purchases_on(self, selected_date):
+        if self.data_processor is not None:
+            date_filter = [('PURCHASE_DATE', '=', selected_date)]
+            header = self.data_processor.scan('purchase_header', columns=['PURCHASE_ID', 'PURCHASE_DATE_TIME'], filters=date_filter)
+            lines = self.data_processor.scan('purchase_lines', columns=['PURCHASE_ID', 'PRODUCT_ID', 'QUANTITY'], filters=date_filter)
+            return header, lines
+
+        day_start = pd.Timestamp(selected_date)
+        header = self.purchase_header_df.iloc[self.index.header_rows_between(day_start, day_start + pd.Timedelta(days=1))]
+        lines = self.purchase_lines_df.iloc[self.index.purchase_line_rows(header['PURCHASE_ID'].tolist())]
+        return header, lines
+
+    # All lines of many purchases with their purchase date and product details: one vectorized
+    # index lookup and one join for the whole list. Also returns the IDs that weren't found.
+    @instrumented()
+    def bulk_purchase_lookup(self, purchase_ids):
+        # Repeated IDs would repeat both the headers and the lines, multiplying rows in the merge
+        purchase_ids = pd.unique(np.asarray(purchase_ids, dtype='int64'))
+        header_rows = self.index.purchase_header_rows(purchase_ids)
+        headers = self.purchase_header_df[['PURCHASE_ID', 'PURCHASE_DATE_TIME']].iloc[header_rows[header_rows >= 0]]
+        lines = self.purchase_lines_df.iloc[self.index.purchase_line_rows(purchase_ids)]
+        result = headers.merge(self.merge_product_details(lines), on='PURCHASE_ID', how='left')
+        return result.reset_index(drop=True), purchase_ids[header_rows < 0].tolist()
+
+    # Mask of the product IDs present in the product table
+    def known_products(self, product_ids):
+        product_ids = np.asarray(product_ids, dtype='int64')
+        return np.isin(product_ids, self.product_df['PRODUCT_ID'].to_numpy()[self.index.product_rows(product_ids)])
+
+    # Every purchase line of many products with the purchase date and product details
+    @instrumented()
+    def bulk_product_lookup(self, product_ids):
+        product_ids = pd.unique(np.asarray(product_ids, dtype='int64'))
+        known = self.known_products(product_ids)
+        lines = self.purchase_lines_df.iloc[self.index.product_line_rows(product_ids[known])]
+        header_rows = self.index.purchase_header_rows(lines['PURCHASE_ID'].to_numpy())
+        lines = lines[header_rows >= 0].assign(
+            PURCHASE_DATE_TIME=self.purchase_header_df['PURCHASE_DATE_TIME'].to_numpy()[header_rows[header_rows >= 0]])
+        result = self.merge_product_details(lines)
+        columns = ['PRODUCT_ID', 'PURCHASE_ID', 'PURCHASE_DATE_TIME', 'QUANTITY']
+        result = result[columns + [col for col in result.columns if col not in columns]]
+        return result.sort_values(columns[:3]).reset_index(drop=True), product_ids[~known].tolist()
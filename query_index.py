@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+# Expands [start, end) ranges into one flat array of positions without a Python loop
+def expand_ranges(starts, ends):
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum()) - np.repeat(offsets, lengths) + np.repeat(starts, lengths)
+
+class PostingIndex:
+    # Maps each key to the row positions holding it: rows are grouped by key once, then a
+    # hash lookup gives the [start, end) slice of the grouped order for any key
+    def __init__(self, keys):
+        keys = np.asarray(keys)
+        self.order = np.argsort(keys, kind='stable')
+        unique_keys, starts, counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+        self.keys = pd.Index(unique_keys)
+        self.starts = starts
+        self.ends = starts + counts
+
+    def rows(self, keys):
+        pos = self.keys.get_indexer(np.atleast_1d(keys))
+        pos = pos[pos >= 0]
+        return self.order[expand_ranges(self.starts[pos], self.ends[pos])]
+
+    # First row of each key, aligned with keys (-1 where the key is missing)
+    def first_rows(self, keys):
+        pos = self.keys.get_indexer(np.atleast_1d(keys))
+        return np.where(pos >= 0, self.order[self.starts[pos]], -1)
+
+class QueryIndex:
+    # Indexes hold row positions only, so they can be shared across sessions and applied to any
+    # view of the same tables (e.g. a product_df with an extra VOLUME column)
+    def __init__(self, product_df, purchase_lines_df, purchase_header_df):
+        self.header_by_purchase = PostingIndex(purchase_header_df['PURCHASE_ID'].to_numpy())
+        self.lines_by_purchase = PostingIndex(purchase_lines_df['PURCHASE_ID'].to_numpy())
+        self.lines_by_product = PostingIndex(purchase_lines_df['PRODUCT_ID'].to_numpy())
+        self.products_by_id = PostingIndex(product_df['PRODUCT_ID'].to_numpy())
+
+        # Header rows sorted by purchase time for date range queries
+        times = purchase_header_df['PURCHASE_DATE_TIME'].to_numpy()
+        self.header_by_time = np.argsort(times, kind='stable')
+        self.sorted_times = times[self.header_by_time]
+
+    @classmethod
+    def from_processor(cls, data_processor):
+        return cls(data_processor.get_df('product'), data_processor.get_df('purchase_lines'),
+            data_processor.get_df('purchase_header'))
+
+    def purchase_header_rows(self, purchase_ids):
+        return self.header_by_purchase.first_rows(purchase_ids)
+
+    def purchase_line_rows(self, purchase_ids):
+        return self.lines_by_purchase.rows(purchase_ids)
+
+    def product_line_rows(self, product_ids):
+        return self.lines_by_product.rows(product_ids)
+
+    def product_rows(self, product_ids):
+        return self.products_by_id.rows(product_ids)
+
+    # Header rows with start <= PURCHASE_DATE_TIME < end, in time order
+    def header_rows_between(self, start, end):
+        lo, hi = np.searchsorted(self.sorted_times, [np.datetime64(start), np.datetime64(end)])
+        return self.header_by_time[lo:hi]
@@ -1,16 +1,13 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-from collections import Counter
+from queries import PurchaseQueries
+from instrumentation import instrumented
 
-class QueryTool:
-    def __init__(self, product_df, purchase_lines_df, purchase_header_df):
-        self.product_df = product_df
-        self.purchase_lines_df = purchase_lines_df
-        self.purchase_header_df = purchase_header_df
-        # Calculate the volume and add it to the product_df
-        self.product_df['VOLUME'] = self.product_df['HEIGHT_INCHES'] * self.product_df['WIDTH_INCHES'] * self.product_df['DEPTH_INCHES']
+# Streamlit rendering of the lookups in PurchaseQueries
+class QueryTool(PurchaseQueries):
 
+    @instrumented()
     def purchase_info(self):
         st.title("Information about your purchase")
         st.subheader("Example Purchase ID: 386880957")
@@ -18,12 +15,10 @@ class QueryTool:
 
         purchase_id = st.text_input("Enter Purchase ID")
         if purchase_id:
-            purchase_id = str(purchase_id).replace(',', '')  # remove commas
+            purchase_id = self.parse_id(purchase_id)
             # Grab relevant info of purchase by querying into other dataframes
             try:
-                purchase_date = self.purchase_header_df.query('PURCHASE_ID == @purchase_id')['PURCHASE_DATE_TIME'].values[0]
-                product_details = self.purchase_lines_df.query('PURCHASE_ID == @purchase_id').merge(
-                    self.product_df, on='PRODUCT_ID').drop(columns=['PURCHASE_ID'])
+                purchase_date, product_details = self.purchase(purchase_id)
                 
                 st.write(f"**Purchase ID**: {purchase_id}")
                 st.write(f"**Purchase Date**: {purchase_date}")
@@ -35,42 +30,33 @@ class QueryTool:
 
     def display_commonly_bought_products(self, product_id):
         try:
-            purchase_ids = self.purchase_lines_df[self.purchase_lines_df['PRODUCT_ID'] == product_id]['PURCHASE_ID'].unique()
-            other_products = []
-
-            for purchase_id in purchase_ids:
-                products_in_purchase = self.purchase_lines_df[self.purchase_lines_df['PURCHASE_ID'] == purchase_id]['PRODUCT_ID'].tolist()
-                other_products.extend([p for p in products_in_purchase if p != product_id])
-            product_counts = Counter(other_products)
-            top_common_products = product_counts.most_common(5)
+            top_common_products = self.top_co_purchases(product_id, 5)
 
             st.write(f"Top 5 commonly bought products with Product ID {product_id}:")
 
-            for product, count in top_common_products:
+            for product, count in zip(top_common_products['PRODUCT_ID'], top_common_products['CO_PURCHASE_COUNT']):
                 st.write(f"Product ID: {product}, Count: {count}")
         except IndexError:
             st.write("Invalid Product ID or data not found.")
 
+    @instrumented()
     def product_info(self):
         st.title("Product Information")
         product_id = st.text_input("Enter Product ID")
         if product_id:
-            product_id = str(product_id).replace(',', '')
+            product_id = self.parse_id(product_id)
 
             try:
-                product_purchase_lines = self.purchase_lines_df[self.purchase_lines_df['PRODUCT_ID'] == str(product_id)]
-                if not product_purchase_lines.empty:
-                    purchase_ids = product_purchase_lines['PURCHASE_ID'].tolist()
-                    quantities = product_purchase_lines['QUANTITY'].tolist()
-                    purchase_dates = []
-                    
-                    for purchase_id in purchase_ids:
-                        purchase_date = self.purchase_header_df.loc[self.purchase_header_df['PURCHASE_ID'] == purchase_id, 'PURCHASE_DATE_TIME'].iloc[0]
-                        purchase_dates.append(purchase_date)
-                    
+                product_purchases = self.product_purchases(product_id)
+
+                if not product_purchases.empty:
+                    purchase_ids = product_purchases['PURCHASE_ID'].tolist()
+                    quantities = product_purchases['QUANTITY'].tolist()
+                    purchase_dates = product_purchases['PURCHASE_DATE_TIME'].tolist()
+
                     st.write("**Product Details**:")
 
-                    product_details = self.product_df.query('PRODUCT_ID == @product_id')
+                    product_details = self.product(product_id)
                     
                     st.dataframe(product_details)
 
@@ -98,6 +84,7 @@ class QueryTool:
             except IndexError:
                 st.write("Invalid Product ID or data not found.")
 
+    @instrumented()
     def purchases_by_date(self):
         st.title("Purchases by Date")
         st.write("Make sure to select a date from 3/25/2020 to 4/12/2020 since that's the time frame of the data")
@@ -105,14 +92,45 @@ class QueryTool:
         selected_date = st.date_input("Select a Date")
 
         if selected_date:
-            self.purchase_header_df['PURCHASE_DATE_TIME'] = pd.to_datetime(self.purchase_header_df['PURCHASE_DATE_TIME'])
-            self.purchase_header_df['PURCHASE_DATE'] = self.purchase_header_df['PURCHASE_DATE_TIME'].dt.strftime('%m/%d/%Y')
-            filtered_purchases = self.purchase_header_df[self.purchase_header_df['PURCHASE_DATE'] == selected_date.strftime('%m/%d/%Y')]
+            filtered_purchases, purchase_lines = self.purchases_on(selected_date)
             
             if not filtered_purchases.empty:
-                purchase_ids = filtered_purchases['PURCHASE_ID'].tolist()
                 st.write(f"**Purchases on {selected_date.strftime('%m/%d/%Y')}**:")
-                purchase_details = self.purchase_lines_df[self.purchase_lines_df['PURCHASE_ID'].isin(purchase_ids)].merge(self.product_df, on='PRODUCT_ID')
+                purchase_details = self.merge_product_details(purchase_lines)
                 st.dataframe(purchase_details)
             else:
                 st.write("No purchases found for the selected date.")
+
+    # IDs from an uploaded file: a CSV's PURCHASE_ID/PRODUCT_ID column (else its first column),
+    # or a plain text file as-is
+    @staticmethod
+    def read_id_file(uploaded, column):
+        if not uploaded.name.lower().endswith('.csv'):
+            return uploaded.getvalue().decode('utf-8', errors='ignore')
+        ids = pd.read_csv(uploaded, dtype=str)
+        ids = ids[column] if column in ids.columns else ids.iloc[:, 0]
+        return "\n".join(ids.dropna())
+
+    @instrumented()
+    def bulk_lookup(self):
+        st.title("Bulk Lookup")
+        id_type = st.radio("ID type", ["Purchase ID", "Product ID"], horizontal=True)
+        text = st.text_area("Paste IDs (one per line, or separated by spaces)")
+        uploaded = st.file_uploader("...or upload a text/CSV file of IDs", type=['txt', 'csv'])
+        if uploaded is not None:
+            text = text + "\n" + self.read_id_file(uploaded, id_type.upper().replace(' ', '_'))
+
+        ids, invalid = self.parse_ids(text)
+        if not ids:
+            return
+        if invalid:
+            st.write(f"Ignored {len(invalid)} entries that aren't IDs: {', '.join(invalid[:10])}")
+
+        lookup = self.bulk_purchase_lookup if id_type == "Purchase ID" else self.bulk_product_lookup
+        result, missing = lookup(ids)
+        st.write(f"**{len(ids) - len(missing)}** of {len(ids)} IDs found, {len(result)} rows")
+        if missing:
+            st.write(f"Not found: {', '.join(map(str, missing[:20]))}" + (" ..." if len(missing) > 20 else ""))
+        st.dataframe(result)
+        st.download_button("Download CSV", result.to_csv(index=False),
+            file_name=f"{id_type.lower().replace(' ', '_')}_lookup.csv", mime='text/csv')
@@ -0,0 +1,338 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+# Streaming popularity statistics: per product line counts and quantities for the whole history
+# and for every hour of the day, department and day, kept in bounded summaries that are updated
+# batch by batch and merged across partitions instead of regrouping the full history.
+#   SpaceSaving     the `capacity` most frequent products with an overestimate bound on each count
+#   CountMinSketch  a point estimate of any product's count in depth x width cells
+# With exact=True every summary keeps all products instead; validate() compares both modes.
+
+# Summary groups and the fact table column each one is keyed on
+GROUPS = {'all': None, 'hour': 'PURCHASE_HOUR', 'department': 'DEPARTMENT_NAME', 'day': 'PURCHASE_DATE'}
+
+# Summed counts per distinct item of a batch, items sorted
+def aggregate(items, weights=None):
+    items = np.asarray(items, dtype=np.int64)
+    weights = np.ones(len(items)) if weights is None else np.asarray(weights, dtype=np.float64)
+    unique, inverse = np.unique(items, return_inverse=True)
+    return unique, np.bincount(inverse, weights=weights, minlength=len(unique))
+
+class SpaceSaving:
+    # The `capacity` items with the highest counts (all of them when capacity is None). An item's
+    # count overestimates its true count by at most its error, and any untracked item's true
+    # count is at most the smallest tracked count. Each item also sums a second weight (the
+    # quantity) over the occurrences it was tracked for, so that sum misses at most `error` of them.
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.items = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0)
+        self.errors = np.empty(0)
+        self.quantities = np.empty(0)
+        self.total = 0.0
+
+    # Count any untracked item may have had, added to it when summaries are merged
+    def floor(self):
+        if self.capacity is None or len(self.items) < self.capacity:
+            return 0.0
+        return float(self.counts.min())
+
+    def update(self, items, counts=None, quantities=None):
+        batch = SpaceSaving(None)
+        batch.items, batch.counts = aggregate(items, counts)
+        batch.quantities = np.zeros(len(batch.items)) if quantities is None else aggregate(items, quantities)[1]
+        batch.errors = np.zeros(len(batch.items))
+        batch.total = float(batch.counts.sum())
+        return self.merge(batch)
+
+    # Mergeable summaries: an item missing from a full summary is counted at that summary's floor
+    # (and the floor is added to its error), then the largest `capacity` counts are kept
+    def merge(self, other):
+        items = np.union1d(self.items, other.items)
+        counts, errors, quantities = np.zeros(len(items)), np.zeros(len(items)), np.zeros(len(items))
+        for summary in (self, other):
+            floor = summary.floor()
+            positions = np.searchsorted(items, summary.items)
+            summary_counts, summary_errors = np.full(len(items), floor), np.full(len(items), floor)
+            summary_counts[positions] = summary.counts
+            summary_errors[positions] = summary.errors
+            counts += summary_counts
+            errors += summary_errors
+            quantities[positions] += summary.quantities
+
+        if self.capacity is not None and len(items) > self.capacity:
+            keep = np.sort(np.lexsort((items, -counts))[:self.capacity])
+            items, counts, errors, quantities = items[keep], counts[keep], errors[keep], quantities[keep]
+        self.items, self.counts, self.errors, self.quantities = items, counts, errors, quantities
+        self.total += other.total
+        return self
+
+    # (items, counts, errors, quantities) of the k highest counts, highest first, ties by item
+    def top(self, k):
+        order = np.lexsort((self.items, -self.counts))[:k]
+        return self.items[order], self.counts[order], self.errors[order], self.quantities[order]
+
+    def state(self):
+        return {'items': self.items, 'counts': self.counts, 'errors': self.errors, 'quantities': self.quantities, 'total': np.array(self.total)}
+
+    @classmethod
+    def from_state(cls, capacity, state):
+        summary = cls(capacity)
+        summary.items, summary.counts, summary.errors, summary.quantities = state['items'], state['counts'], state['errors'], state['quantities']
+        summary.total = float(state['total'])
+        return summary
+
+class CountMinSketch:
+    # depth rows of width counters, one multiply-shift hash per row; an estimate never
+    # undercounts and exceeds the true count by more than e/width of the total weight with
+    # probability at most exp(-depth). width must be a power of two.
+    def __init__(self, width=1024, depth=4, seed=0):
+        if width & (width - 1):
+            raise ValueError(f"Count-Min width must be a power of two, got {width}")
+        self.width, self.depth, self.seed = width, depth, seed
+        rng = np.random.default_rng(seed)
+        self.multipliers = rng.integers(1, 2**63, depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.offsets = rng.integers(0, 2**63, depth, dtype=np.uint64)
+        self.shift = np.uint64(64 - (width.bit_length() - 1))
+        self.table = np.zeros((depth, width))
+
+    # Counter of each item in each row, wrapping uint64 arithmetic
+    def cells(self, items):
+        items = np.asarray(items, dtype=np.int64).astype(np.uint64)
+        return ((self.multipliers[:, None] * items[None, :] + self.offsets[:, None]) >> self.shift).astype(np.intp)
+
+    def update(self, items, counts=None):
+        items, counts = aggregate(items, counts)
+        for row, cells in enumerate(self.cells(items)):
+            self.table[row] += np.bincount(cells, weights=counts, minlength=self.width)
+        return self
+
+    def estimate(self, items):
+        cells = self.cells(items)
+        return self.table[np.arange(self.depth)[:, None], cells].min(axis=0)
+
+    def merge(self, other):
+        if (self.width, self.depth, self.seed) != (other.width, other.depth, other.seed):
+            raise ValueError("Only Count-Min sketches with the same width, depth and seed can be merged")
+        self.table += other.table
+        return self
+
+    def state(self):
+        return {'table': self.table}
+
+    @classmethod
+    def from_state(cls, width, depth, seed, state):
+        sketch = cls(width, depth, seed)
+        sketch.table = state['table']
+        return sketch
+
+class ExactCounts:
+    # Same interface as CountMinSketch with exact per item totals, for validation
+    def __init__(self):
+        self.items = np.empty(0, dtype=np.int64)
+        self.values = np.empty(0)
+
+    def update(self, items, counts=None):
+        other = ExactCounts()
+        other.items, other.values = aggregate(items, counts)
+        return self.merge(other)
+
+    def estimate(self, items):
+        items = np.asarray(items, dtype=np.int64)
+        positions = np.searchsorted(self.items, items)
+        found = positions < len(self.items)
+        found[found] = self.items[positions[found]] == items[found]
+        estimates = np.zeros(len(items))
+        estimates[found] = self.values[positions[found]]
+        return estimates
+
+    def merge(self, other):
+        self.items, self.values = aggregate(np.concatenate([self.items, other.items]), np.concatenate([self.values, other.values]))
+        return self
+
+    def state(self):
+        return {'items': self.items, 'values': self.values}
+
+    @classmethod
+    def from_state(cls, state):
+        counts = cls()
+        counts.items, counts.values = state['items'], state['values']
+        return counts
+
+class PopularityStats:
+    # One summary per group key ('all', 'hour=13', 'department=Produce', 'day=2020-04-06'):
+    # Space-Saving over line counts for top-k lists, Count-Min over line counts and quantities
+    # for point estimates. Memory is bounded per key, whatever the number of purchase lines.
+    def __init__(self, capacity=1000, width=1024, depth=4, seed=0, exact=False):
+        self.capacity = None if exact else capacity
+        self.width, self.depth, self.seed = width, depth, seed
+        self.exact = exact
+        self.summaries = {}
+
+    @staticmethod
+    def key_name(group, key=None):
+        if group not in GROUPS:
+            raise ValueError(f"Unknown group {group!r}, expected one of {', '.join(GROUPS)}")
+        if group == 'all':
+            return 'all'
+        if group == 'hour':
+            key = int(key)
+        elif group == 'day':
+            key = pd.Timestamp(key).strftime('%Y-%m-%d')
+        return f"{group}={key}"
+
+    def new_summary(self):
+        counts = ExactCounts if self.exact else (lambda: CountMinSketch(self.width, self.depth, self.seed))
+        return {'top': SpaceSaving(self.capacity), 'lines': counts(), 'quantity': counts()}
+
+    def summary(self, name):
+        if name not in self.summaries:
+            self.summaries[name] = self.new_summary()
+        return self.summaries[name]
+
+    # Folds fact rows (PRODUCT_ID, QUANTITY and the group columns) into the summaries
+    def update(self, fact):
+        for group, column in GROUPS.items():
+            keys = [np.zeros(len(fact), dtype=np.int8) if column is None else fact[column], fact['PRODUCT_ID']]
+            totals = fact.groupby(keys, observed=True)['QUANTITY'].agg(['size', 'sum'])
+            for key, part in totals.groupby(level=0, sort=False, observed=True):
+                summary = self.summary(self.key_name(group, key))
+                products = part.index.get_level_values(1).to_numpy()
+                summary['top'].update(products, part['size'].to_numpy(), part['sum'].to_numpy())
+                summary['lines'].update(products, part['size'].to_numpy())
+                summary['quantity'].update(products, part['sum'].to_numpy())
+        return self
+
+    # Combines the statistics of another partition of the data, e.g. an ingested batch
+    def merge(self, other):
+        if (self.capacity, self.width, self.depth, self.seed, self.exact) != (other.capacity, other.width, other.depth, other.seed, other.exact):
+            raise ValueError("Only popularity statistics built with the same parameters can be merged")
+        for name, other_summary in other.summaries.items():
+            summary = self.summary(name)
+            for part in summary:
+                summary[part].merge(other_summary[part])
+        return self
+
+    def keys(self, group):
+        prefix = f"{group}="
+        return [name[len(prefix):] for name in self.summaries if name.startswith(prefix)]
+
+    # PRODUCT_ID, LINE_COUNT, QUANTITY, ERROR of the k most bought products of one group key;
+    # LINE_COUNT - ERROR is a lower bound of the true line count, and QUANTITY leaves out at most
+    # ERROR lines. ERROR is 0 until products drop out of a full summary.
+    def top(self, group='all', key=None, k=10):
+        summary = self.summaries.get(self.key_name(group, key))
+        if summary is None:
+            return pd.DataFrame({'PRODUCT_ID': pd.Series(dtype='int64'), 'LINE_COUNT': pd.Series(dtype='float64'),
+                'QUANTITY': pd.Series(dtype='float64'), 'ERROR': pd.Series(dtype='float64')})
+        items, counts, errors, quantities = summary['top'].top(k)
+        return pd.DataFrame({'PRODUCT_ID': items, 'LINE_COUNT': counts, 'QUANTITY': quantities, 'ERROR': errors})
+
+    # Estimated LINE_COUNT and QUANTITY of any products within one group key
+    def estimate(self, product_ids, group='all', key=None):
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        summary = self.summaries.get(self.key_name(group, key), self.new_summary())
+        return pd.DataFrame({'PRODUCT_ID': product_ids, 'LINE_COUNT': summary['lines'].estimate(product_ids),
+            'QUANTITY': summary['quantity'].estimate(product_ids)})
+
+    # PURCHASE_HOUR, PRODUCT_ID, COUNT of the most bought products of each hour, ties included
+    def hourly_top(self):
+        hours, items, counts = [], [], []
+        for hour in sorted(self.keys('hour'), key=int):
+            top = self.summaries[self.key_name('hour', hour)]['top']
+            if len(top.counts):
+                most = top.counts == top.counts.max()
+                hours.append(np.full(most.sum(), int(hour)))
+                items.append(top.items[most])
+                counts.append(top.counts[most])
+        return pd.DataFrame({
+            'PURCHASE_HOUR': np.concatenate(hours or [[]]).astype(np.int8),
+            'PRODUCT_ID': np.concatenate(items or [[]]).astype(np.int64),
+            'COUNT': np.concatenate(counts or [[]]).astype(np.int64)
+        })
+
+    def nbytes(self):
+        return sum(array.nbytes for summary in self.summaries.values() for part in summary.values() for array in part.state().values())
+
+    # Plain arrays in one .npz (no pickling), written atomically
+    def save(self, path):
+        arrays = {
+            'params': np.array([self.capacity or 0, self.width, self.depth, self.seed, self.exact], dtype=np.int64),
+            'keys': np.array(list(self.summaries), dtype=str)
+        }
+        for i, summary in enumerate(self.summaries.values()):
+            for part, counter in summary.items():
+                for field, array in counter.state().items():
+                    arrays[f"{i}.{part}.{field}"] = array
+        with open(path + '.tmp', 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(path + '.tmp', path)
+        return self
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            capacity, width, depth, seed, exact = (int(value) for value in data['params'])
+            stats = cls(capacity or None, width, depth, seed, bool(exact))
+            for i, name in enumerate(data['keys']):
+                state = {}
+                for file in data.files:
+                    prefix = f"{i}."
+                    if file.startswith(prefix):
+                        part, field = file[len(prefix):].split('.')
+                        state.setdefault(part, {})[field] = data[file]
+                summary = {'top': SpaceSaving.from_state(stats.capacity, state['top'])}
+                for part in ('lines', 'quantity'):
+                    summary[part] = ExactCounts.from_state(state[part]) if stats.exact else CountMinSketch.from_state(width, depth, seed, state[part])
+                stats.summaries[str(name)] = summary
+        return stats
+
+# Builds the statistics once from the whole fact table and once per day partition merged
+# together, and reports how far both are from the exact answers for every group key
+def validate(fact, capacity=1000, width=1024, depth=4, k=10):
+    exact = PopularityStats(exact=True).update(fact)
+    streamed = PopularityStats(capacity, width, depth)
+    for _, part in fact.groupby('PURCHASE_DATE'):
+        streamed.merge(PopularityStats(capacity, width, depth).update(part))
+    results = []
+    for mode, stats in [('whole', PopularityStats(capacity, width, depth).update(fact)), ('merged days', streamed)]:
+        for name in exact.summaries:
+            group, _, key = name.partition('=')
+            expected = exact.top(group, key or None, k)
+            estimated = stats.top(group, key or None, k)
+            # Compare against the true counts at the same rank, since ties may be ordered differently
+            true_lines = exact.estimate(estimated['PRODUCT_ID'], group, key or None)
+            products, true_counts = exact.summaries[name]['lines'].items, exact.summaries[name]['lines'].values
+            results.append({
+                'mode': mode,
+                'key': name,
+                'recall': len(set(expected['PRODUCT_ID']) & set(estimated['PRODUCT_ID'])) / max(len(expected), 1),
+                'rank_count_error': float(np.abs(estimated['LINE_COUNT'].to_numpy() - expected['LINE_COUNT'].to_numpy()[:len(estimated)]).max(initial=0)),
+                'count_error': float((estimated['LINE_COUNT'] - true_lines['LINE_COUNT']).to_numpy().max(initial=0)),
+                'quantity_error': float(np.abs(estimated['QUANTITY'] - true_lines['QUANTITY']).to_numpy().max(initial=0)),
+                # Count-Min point estimates of every product bought under that key
+                'estimate_error': float((stats.estimate(products, group, key or None)['LINE_COUNT'].to_numpy() - true_counts).max(initial=0))
+            })
+    return pd.DataFrame(results), {'exact': exact.nbytes(), 'sketch': streamed.nbytes()}
+
+def main():
+    from data_processor import DataProcessor
+    parser = argparse.ArgumentParser(description="Accuracy and size of the popularity sketches against exact counts")
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--capacity', type=int, default=1000, help="Products tracked per Space-Saving summary")
+    parser.add_argument('--width', type=int, default=1024, help="Count-Min counters per row (power of two)")
+    parser.add_argument('--depth', type=int, default=4, help="Count-Min rows")
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    fact = DataProcessor(args.data_dir).get_df('fact')
+    results, sizes = validate(fact, args.capacity, args.width, args.depth, args.k)
+    summary = results.groupby('mode').agg(keys=('key', 'size'), min_recall=('recall', 'min'), max_rank_count_error=('rank_count_error', 'max'),
+        max_count_error=('count_error', 'max'), max_quantity_error=('quantity_error', 'max'), max_estimate_error=('estimate_error', 'max'))
+    print(summary.to_string())
+    print(f"exact counters: {sizes['exact'] / 2**20:.1f} MB, sketches: {sizes['sketch'] / 2**20:.1f} MB for {len(fact)} purchase lines")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+# Synthetic product/purchase_header/purchase_lines tables in the same raw format as data/
+# (string IDs, text timestamps), for benchmarking at sizes the sample can't reach. Product
+# popularity is Zipf-skewed, basket sizes are over-dispersed around the sample's mean of ~19
+# lines, and purchase hours follow the sample's daily profile.
+
+DEPARTMENTS = ['Alcohol', 'Babies', 'Bakery', 'Beverages', 'Books, Cards, & Magazines', 'Breakfast', 'Bulk',
+    'Canned Goods', 'Dairy & Eggs', 'Deli', 'Dry Goods & Pasta', 'Floral', 'Frozen', 'Household', 'International',
+    'Lifestyle', 'Meat & Seafood', 'Pantry', 'Personal Care', 'Pets', 'Popular', 'Produce', 'Snacks']
+
+# Purchases per hour of day in the sample data
+HOUR_WEIGHTS = np.array([233, 153, 117, 125, 140, 211, 517, 1022, 1366, 1403, 1621, 2012, 2013, 1850, 1662,
+    1597, 1683, 1383, 1284, 1127, 999, 824, 555, 388], dtype=float)
+
+def generate(products=10_000, lines=1_000_000, days=90, start='2020-01-01', mean_basket=19, zipf=1.1, seed=0):
+    rng = np.random.default_rng(seed)
+
+    product_ids = rng.choice(np.arange(100, products * 200), size=products, replace=False)
+    dimensions = rng.lognormal(mean=1.6, sigma=0.6, size=(products, 3)).round(2)
+    # Roughly the sample's share of missing dimensions
+    dimensions[rng.random((products, 3)) < [0.4, 0.4, 0.65]] = np.nan
+    weights = rng.lognormal(mean=5.5, sigma=1.0, size=products).round()
+    weights[rng.random(products) < 0.12] = np.nan
+    product = pd.DataFrame({
+        'PRODUCT_ID': product_ids.astype(str),
+        'DEPARTMENT_NAME': rng.choice(DEPARTMENTS, size=products),
+        'HEIGHT_INCHES': dimensions[:, 0],
+        'WIDTH_INCHES': dimensions[:, 1],
+        'DEPTH_INCHES': dimensions[:, 2],
+        'WEIGHT_GRAMS': weights
+    })
+
+    # Basket sizes: Poisson around a gamma-distributed mean, at least one line each
+    n_purchases = max(lines // mean_basket, 1)
+    basket_sizes = 1 + rng.poisson(rng.gamma(shape=2.0, scale=(mean_basket - 1) / 2.0, size=n_purchases))
+    purchase_ids = rng.choice(np.arange(10**8, 10**8 + n_purchases * 20), size=n_purchases, replace=False)
+
+    days_offset = rng.integers(0, days, size=n_purchases)
+    hours = rng.choice(24, size=n_purchases, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    seconds = rng.integers(0, 3600 * 10, size=n_purchases) / 10
+    times = pd.Timestamp(start) + pd.to_timedelta(days_offset, unit='D') + pd.to_timedelta(hours * 3600 + seconds, unit='s')
+    purchase_header = pd.DataFrame({
+        'PURCHASE_ID': purchase_ids.astype(str),
+        'PURCHASE_DATE_TIME': times.strftime('%m/%d/%Y %H:%M:%S.%f')
+    })
+
+    # Zipf popularity: the product of rank r is picked with probability proportional to 1 / r^zipf
+    popularity = 1 / np.arange(1, products + 1) ** zipf
+    line_products = product_ids[rng.permutation(products)][
+        np.searchsorted(np.cumsum(popularity / popularity.sum()), rng.random(basket_sizes.sum()), side='right').clip(max=products - 1)]
+    quantities = 1 + rng.poisson(0.7, size=len(line_products)).astype(float)
+    by_weight = rng.random(len(line_products)) < 0.08
+    quantities[by_weight] = rng.lognormal(mean=-0.3, sigma=0.6, size=by_weight.sum()).round(2)
+    purchase_lines = pd.DataFrame({
+        'PURCHASE_ID': np.repeat(purchase_ids, basket_sizes).astype(str),
+        'PRODUCT_ID': line_products.astype(str),
+        'QUANTITY': quantities
+    })
+    return {'product': product, 'purchase_header': purchase_header, 'purchase_lines': purchase_lines}
+
+def write(tables, data_dir):
+    os.makedirs(data_dir, exist_ok=True)
+    for name, df in tables.items():
+        df.to_parquet(os.path.join(data_dir, f"{name}.parquet"), index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic data directory")
+    parser.add_argument('data_dir', help="Directory to write product/purchase_header/purchase_lines.parquet to")
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--lines', type=int, default=1_000_000, help="Approximate number of purchase lines")
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tables = generate(args.products, args.lines, args.days, seed=args.seed)
+    write(tables, args.data_dir)
+    print(', '.join(f"{name}: {len(df)} rows" for name, df in tables.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic_data
+from data_processor import DataProcessor
+
+# A small synthetic data directory per test, in the raw format of data/
+@pytest.fixture
+def data_dir(tmp_path):
+    synthetic_data.write(synthetic_data.generate(products=200, lines=5_000, days=10, seed=0), str(tmp_path / 'data'))
+    DataProcessor.clear_cache()
+    yield str(tmp_path / 'data')
+    DataProcessor.clear_cache()
@@ -0,0 +1,173 @@
+import os
+import glob
+import pandas as pd
+import pytest
+import synthetic_data
+from data_processor import DataProcessor, ROLLUP_KEYS
+
+def test_cached_tables_are_read_only(data_dir):
+    df = DataProcessor(data_dir).get_df('purchase_lines')
+    quantity = df['QUANTITY'].iloc[0]
+    with pytest.raises(ValueError):
+        df.loc[0, 'QUANTITY'] = 999
+    with pytest.raises(ValueError):
+        df['QUANTITY'].values[1] = 777
+    # Adding or replacing columns on the view stays local to it
+    df['QUANTITY'] = df['QUANTITY'] * 2
+    df['VOLUME'] = 1.0
+
+    fresh = DataProcessor(data_dir).get_df('purchase_lines')
+    assert fresh['QUANTITY'].iloc[0] == quantity
+    assert 'VOLUME' not in fresh.columns
+
+def test_derived_tables_are_read_only(data_dir):
+    daily = DataProcessor(data_dir).get_df('daily')
+    with pytest.raises(ValueError):
+        daily.loc[0, 'QUANTITY'] = -1
+
+# A later extract in the raw format: new purchases of known products, dated after the base data
+def new_batch(data_processor, purchases=50):
+    base_header = data_processor.get_df('purchase_header')
+    tables = synthetic_data.generate(products=50, lines=purchases * 19, days=3, start='2021-01-01', seed=1)
+    header, lines = tables['purchase_header'], tables['purchase_lines']
+    header['PURCHASE_ID'] = (header['PURCHASE_ID'].astype('int64') + base_header['PURCHASE_ID'].max()).astype(str)
+    lines['PURCHASE_ID'] = (lines['PURCHASE_ID'].astype('int64') + base_header['PURCHASE_ID'].max()).astype(str)
+    product_ids = data_processor.get_df('product')['PRODUCT_ID'].to_numpy()
+    lines['PRODUCT_ID'] = pd.factorize(lines['PRODUCT_ID'])[0] % len(product_ids)
+    lines['PRODUCT_ID'] = product_ids[lines['PRODUCT_ID']].astype(str)
+    return header, lines
+
+def sorted_rollup(df, name):
+    return df.sort_values(ROLLUP_KEYS[name]).reset_index(drop=True)
+
+def test_ingested_rollups_match_full_build(data_dir):
+    data_processor = DataProcessor(data_dir)
+    data_processor.materialize()
+    base_header = data_processor.get_df('purchase_header')
+    base_lines = data_processor.get_df('purchase_lines')
+    header, lines = new_batch(data_processor)
+    # A line sent twice within the batch and a re-sent purchase are both counted once
+    lines = pd.concat([lines, lines.iloc[:1]], ignore_index=True)
+    header = pd.concat([header, header.iloc[:1]], ignore_index=True)
+
+    summary = data_processor.ingest_batch(header, lines)
+    assert summary['skipped_purchases'] == 1
+    assert summary['skipped_lines'] >= 1
+    assert summary['lines'] == len(data_processor.get_df('purchase_lines')) - len(base_lines)
+
+    batch_header = DataProcessor.normalize(header.drop_duplicates('PURCHASE_ID').copy())
+    batch_lines = DataProcessor.normalize(lines.copy()).drop_duplicates(['PURCHASE_ID', 'PRODUCT_ID'])
+    expected = data_processor.build_aggregates(pd.concat([base_header, batch_header], ignore_index=True),
+        pd.concat([base_lines, batch_lines], ignore_index=True))
+    for name in ['daily', 'product_daily', 'hourly', 'department_daily']:
+        pd.testing.assert_frame_equal(sorted_rollup(data_processor.get_df(name), name),
+            sorted_rollup(expected[name], name), check_dtype=False, check_categorical=False)
+
+    # Ingesting the same extract again changes nothing, and every line counts as skipped
+    summary = data_processor.ingest_batch(header, lines)
+    assert summary['purchases'] == 0
+    assert summary['skipped_lines'] == len(lines)
+
+def test_ingest_rejects_unknown_products(data_dir):
+    data_processor = DataProcessor(data_dir)
+    header, lines = new_batch(data_processor)
+    lines.loc[0, 'PRODUCT_ID'] = '1'
+    with pytest.raises(ValueError, match='products missing from product'):
+        data_processor.ingest_batch(header, lines)
+
+def test_ingest_rejects_columns_the_dataset_lacks(data_dir):
+    data_processor = DataProcessor(data_dir)
+    header, lines = new_batch(data_processor)
+    with pytest.raises(ValueError, match='STORE_ID'):
+        data_processor.ingest_batch(header.assign(STORE_ID=1), lines)
+
+def shared_files(data_dir):
+    return set(os.listdir(os.path.join(data_dir, 'shared')))
+
+def test_shared_files_are_only_removed_by_prune(data_dir):
+    data_processor = DataProcessor(data_dir, shared=True)
+    daily = data_processor.get_df('daily')
+    published = shared_files(data_dir)
+
+    header, lines = new_batch(data_processor)
+    data_processor.ingest_batch(header, lines)
+    for name in data_processor.derived_tables:
+        data_processor.get_df(name)
+    # Loading the new version publishes new files and leaves the old ones to other processes
+    assert published < shared_files(data_dir)
+
+    assert data_processor.prune_shared()
+    # Only product, which the batch didn't touch, is still on the same version
+    assert published & shared_files(data_dir) == {name for name in published if name.startswith('product-')}
+    # What is left is exactly the current version: loading it from scratch publishes nothing new
+    remaining = shared_files(data_dir)
+    DataProcessor.clear_cache()
+    current = DataProcessor(data_dir, shared=True)
+    for name in current.derived_tables:
+        current.get_df(name)
+    assert shared_files(data_dir) == remaining
+    # Mapped frames of the removed version stay readable
+    assert daily['QUANTITY'].sum() > 0
+
+    # A process that finds its file pruned publishes it again
+    DataProcessor.clear_cache()
+    for name in shared_files(data_dir):
+        os.remove(os.path.join(data_dir, 'shared', name))
+    assert len(DataProcessor(data_dir, shared=True).get_df('purchase_lines')) == len(data_processor.get_df('purchase_lines'))
+
+def test_replaced_raw_extract_is_imported_again(data_dir):
+    data_processor = DataProcessor(data_dir)
+    header, lines = new_batch(data_processor)
+    data_processor.ingest_batch(header, lines)
+    stored = len(data_processor.get_df('purchase_header'))
+
+    # The new extract adds one purchase and also holds the first ingested one, which must not be
+    # stored twice
+    resent = header['PURCHASE_ID'].iloc[0]
+    added = str(int(header['PURCHASE_ID'].astype('int64').max()) + 1)
+    for file, batch in [('purchase_header', header), ('purchase_lines', lines)]:
+        path = os.path.join(data_dir, f"{file}.parquet")
+        rows = batch[batch['PURCHASE_ID'] == resent]
+        pd.concat([pd.read_parquet(path), rows, rows.assign(PURCHASE_ID=added)], ignore_index=True).to_parquet(path, index=False)
+
+    DataProcessor.clear_cache()
+    data_processor = DataProcessor(data_dir)
+    purchase_header = data_processor.get_df('purchase_header')
+    assert len(purchase_header) == stored + 1
+    assert purchase_header['PURCHASE_ID'].is_unique
+    assert not data_processor.build_dataset()
+
+def test_ingest_accepts_whole_second_timestamps(data_dir, tmp_path):
+    data_processor = DataProcessor(data_dir)
+    header, lines = new_batch(data_processor, purchases=20)
+    header['PURCHASE_DATE_TIME'] = pd.to_datetime(header['PURCHASE_DATE_TIME'], format='%m/%d/%Y %H:%M:%S.%f') \
+        .dt.floor('s').dt.strftime('%-m/%-d/%Y %H:%M:%S')
+    half = header['PURCHASE_ID'].iloc[:10]
+
+    # One half as DataFrames, the other as CSV extracts: both go through the same parser
+    in_half = lines['PURCHASE_ID'].isin(half)
+    assert data_processor.ingest_batch(header[header['PURCHASE_ID'].isin(half)], lines[in_half])['purchases'] == 10
+    header[~header['PURCHASE_ID'].isin(half)].to_csv(tmp_path / 'header.csv', index=False)
+    lines[~in_half].to_csv(tmp_path / 'lines.csv', index=False)
+    assert data_processor.ingest_batch(str(tmp_path / 'header.csv'), str(tmp_path / 'lines.csv'))['purchases'] == len(header) - 10
+
+    stored = data_processor.get_df('purchase_header').set_index('PURCHASE_ID')['PURCHASE_DATE_TIME']
+    expected = pd.to_datetime(header['PURCHASE_DATE_TIME'], format='%m/%d/%Y %H:%M:%S').to_numpy()
+    assert (stored.loc[header['PURCHASE_ID'].astype('int64')].to_numpy() == expected).all()
+
+def test_ingested_batches_are_compacted(data_dir):
+    data_processor = DataProcessor(data_dir)
+    data_processor.materialize()
+    stored = len(data_processor.get_df('purchase_header'))
+    header, lines = new_batch(data_processor, purchases=60)
+    # Three batches over the same dates
+    for batch in range(3):
+        ids = header['PURCHASE_ID'].iloc[batch::3]
+        data_processor.ingest_batch(header[header['PURCHASE_ID'].isin(ids)], lines[lines['PURCHASE_ID'].isin(ids)])
+
+    for file in ['purchase_header', 'purchase_lines']:
+        for partition in glob.glob(os.path.join(data_dir, 'partitions', file, 'PURCHASE_DATE=*')):
+            assert len(glob.glob(os.path.join(partition, '*.parquet'))) <= 2
+    assert len(glob.glob(os.path.join(data_dir, 'derived', 'fact', '*.parquet'))) == 2
+    assert len(data_processor.get_df('purchase_header')) == stored + len(header)
+    assert len(data_processor.get_df('fact')) == len(data_processor.get_df('purchase_lines'))
@@ -0,0 +1,77 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from data_processor import DataProcessor
+from modeling import ForecastModels, KERNEL_MODELS, KERNEL_ROWS, build_model, training_rows
+from model_registry import data_fingerprint
+
+# Offline training entry point: fits the MODEL_SPECS estimators in parallel worker processes on a
+# chronological split, then registers every artifact (atomically) and its metrics from the
+# parent process. The Streamlit app only ever reads what this writes.
+
+def set_threads(model, n_jobs):
+    if 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=n_jobs)
+    # A fitted CatBoost model rejects set_params. It needs no reset: its predict ignores the stored
+    # thread_count and takes one per call instead (CatBoostPredictor passes it).
+    elif type(model).__module__.startswith('catboost') and not model.is_fitted():
+        model.set_params(thread_count=n_jobs)
+    return model
+
+def fit_model(model_name, model, splits, n_jobs, max_rows):
+    from threadpoolctl import threadpool_limits
+    start = time.time()
+    model = set_threads(model, n_jobs)
+    X_train, y_train = training_rows(model_name, splits[0], splits[1], max_rows)
+    # BLAS (linear models) and OpenMP pools are capped too, so workers don't oversubscribe the cores
+    with threadpool_limits(n_jobs):
+        model.fit(X_train, y_train)
+        # Train metrics cover the rows the model was fitted on; scoring a kernel model on the whole
+        # training split would cost several times its fit
+        metrics = ForecastModels.evaluate_model(model, X_train, y_train, splits[2], splits[3])
+    return model_name, model, metrics, data_fingerprint(X_train), len(X_train), time.time() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and register the purchase forecasting models")
+    parser.add_argument('--models', nargs='+', help="Subset of models to train (default: all)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of training processes")
+    parser.add_argument('--n-jobs', type=int, help="Threads per model where the estimator supports it (default: the cores split across the workers)")
+    parser.add_argument('--kernel-rows', type=int, default=KERNEL_ROWS, help="Training rows randomly sampled for kernel "
+        "models (SVR), whose fit time grows quadratically with rows: on the full panel's ~240k training rows SVR "
+        "would take hours (0: all rows). Test metrics still cover the full test split")
+    parser.add_argument('--test-size', type=float, default=0.2, help="Fraction of the most recent rows held out")
+    args = parser.parse_args()
+
+    data_processor = DataProcessor()
+    model_trainer = ForecastModels(data_processor.get_df('product'), data_processor.get_df('purchase_lines'),
+        data_processor.get_df('purchase_header'), data_processor)
+    model_names = args.models or model_trainer.model_names
+    unknown = set(model_names) - set(model_trainer.model_names)
+    if unknown:
+        parser.error(f"Unknown models: {', '.join(sorted(unknown))}")
+
+    splits = model_trainer.train_test_splits(args.test_size)
+    data_version = data_fingerprint(model_trainer.data)
+    print(f"Training {len(model_names)} models on {len(splits[0])} rows, testing on {len(splits[2])} rows")
+
+    workers = max(1, min(args.workers, len(model_names)))
+    n_jobs = args.n_jobs or max(1, (os.cpu_count() or 1) // workers)
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fit_model, model_name, build_model(model_name), splits, n_jobs, args.kernel_rows)
+            for model_name in model_names]
+        for future in as_completed(futures):
+            model_name, model, metrics, training_fingerprint, rows, elapsed = future.result()
+            # Artifacts are loaded by the app and the API for small predictions, where thread pools
+            # over every core cost more than they save; prediction paths that want more pass it per call
+            model = set_threads(model, 1)
+            metadata = model_trainer.save_model(model_name, model, training_fingerprint, metrics,
+                args.kernel_rows if model_name in KERNEL_MODELS else None)
+            model_trainer.metrics_store.put(model_name, data_version, metadata['sha256'], metrics)
+            print(f"{model_name}: fitted on {rows} rows in {elapsed:.1f}s, test MAE {metrics['test_mae']:.3f}, "
+                f"test R2 {metrics['test_r2']:.3f} (v{metadata['version']})")
+    print(f"Done in {time.time() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import os
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from data_processor import DataProcessor
+from query_index import QueryIndex
+from co_purchase import CoPurchaseEngine
+from analytics import AnalyticsEngine
+from model_registry import ModelRegistry
+from modeling import ForecastModels
+from metrics_store import MetricsStore
+from forecast_store import ForecastStore
+import instrumentation
+
+# Builds everything the pages would otherwise build on their first visit: the dataset and
+# derived tables, the query index, the co-purchase matrix, analytics views and static charts,
+# the model metrics (and with them the feature frame) and the default model. The app starts it
+# in a background thread pool when the process starts, so Home serves immediately and the other
+# pages read the readiness status instead of blocking. As a pre-deploy command,
+#   python warmup.py
+# builds the persisted part (dataset, derived tables, metrics) before the server starts.
+
+# Task names in dependency order: (name, dependencies, persisted to disk)
+TASKS = [
+    ('data', [], True),
+    ('query_index', ['data'], False),
+    ('co_purchase', ['data'], False),
+    ('analytics', ['data'], False),
+    ('figures', ['analytics'], False),
+    ('default_model', ['data'], True),
+    ('metrics', ['default_model'], True)
+]
+
+# What each page needs before it renders without cold costs
+PAGE_TASKS = {
+    "Data Analysis 📊": ['data', 'analytics', 'figures'],
+    "Query Tool 🔍": ['data', 'query_index', 'co_purchase'],
+    "ML Modeling 🤖": ['data', 'co_purchase', 'default_model']
+}
+
+_WARMUP = None
+_WARMUP_LOCK = threading.Lock()
+
+class Warmup:
+    def __init__(self, data_dir='data', model_dir='models', tasks=None):
+        self.data_dir = data_dir
+        self.model_dir = model_dir
+        self.tasks = [task for task in TASKS if tasks is None or task[0] in tasks]
+        self.status = {name: {'state': 'pending', 'seconds': None, 'error': None} for name, _, _ in self.tasks}
+        self.futures = {}
+        self.data_processor = None
+
+    # Submits the tasks in dependency order; a task waits for its dependencies inside its worker.
+    # Dependencies are always submitted first, so they are running or done by then.
+    def start(self, workers=4):
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warmup')
+        for name, dependencies, _ in self.tasks:
+            self.futures[name] = executor.submit(self.run_task, name, [dep for dep in dependencies if dep in self.futures])
+        executor.shutdown(wait=False)
+        return self
+
+    def wait(self):
+        for future in self.futures.values():
+            future.result()
+        return self
+
+    def run_task(self, name, dependencies):
+        for dependency in dependencies:
+            self.futures[dependency].result()
+        failed = [dependency for dependency in dependencies if self.status[dependency]['state'] != 'ready']
+        if failed:
+            self.status[name].update(state='failed', seconds=0.0, error=f"{', '.join(failed)} failed")
+            return
+
+        instrumentation.start_run('warmup')
+        self.status[name]['state'] = 'running'
+        start = time.time()
+        try:
+            with instrumentation.stage(f"warmup {name}"):
+                getattr(self, f"warm_{name}")()
+            self.status[name]['state'] = 'ready'
+        except Exception as e:
+            # Pages fall back to building what they need themselves
+            self.status[name].update(state='failed', error=f"{type(e).__name__}: {e}")
+        self.status[name]['seconds'] = time.time() - start
+
+    def warm_data(self):
+        self.data_processor = DataProcessor(self.data_dir)
+        self.data_processor.materialize()
+        # With SHARED_TABLES=1 this also publishes the rollups, so other processes only map them
+        if self.data_processor.shared:
+            for name in self.data_processor.derived_tables:
+                self.data_processor.load_derived(name)
+
+    def warm_query_index(self):
+        self.data_processor.get_resource('query_index', QueryIndex.from_processor)
+
+    def warm_co_purchase(self):
+        self.data_processor.get_resource('co_purchase', CoPurchaseEngine.from_processor)
+
+    def warm_analytics(self):
+        self.data_processor.get_resource('analytics', AnalyticsEngine.from_processor)
+
+    # Charts with no widget inputs; the page module (and Streamlit) is only imported here
+    def warm_figures(self):
+        from data_analysis_page import DataPlots
+        DataPlots(self.data_processor, self.data_processor.get_df('product'), self.data_processor.get_df('purchase_lines'),
+            self.data_processor.get_df('purchase_header'), self.data_processor.get_resource('analytics', AnalyticsEngine.from_processor)).warm_cache()
+
+    def model_trainer(self):
+        model_trainer = ForecastModels(self.data_processor.get_df('product'), self.data_processor.get_df('purchase_lines'),
+            self.data_processor.get_df('purchase_header'), self.data_processor)
+        model_trainer.registry = ModelRegistry(self.model_dir)
+        model_trainer.metrics_store = MetricsStore(os.path.join(self.model_dir, 'metrics.parquet'))
+        model_trainer.forecast_store = ForecastStore(self.model_dir)
+        return model_trainer
+
+    # The model the modeling page selects first, loaded and with its metrics stored; evaluating
+    # it also caches the feature frame
+    def warm_default_model(self):
+        model_trainer = self.model_trainer()
+        trained = model_trainer.trained_models()
+        if trained:
+            model_trainer.train_and_evaluate(trained[:1])
+            model_trainer.load_model(trained[0])
+
+    # Stored metrics of the other trained models. Scoring all of them can take minutes on a cold
+    # metrics store, so no page waits for this.
+    def warm_metrics(self):
+        model_trainer = self.model_trainer()
+        trained = model_trainer.trained_models()
+        model_trainer.train_and_evaluate(trained[1:])
+        # Scoring went through the registry's LRU cache; keep the default model the most recent
+        if trained:
+            model_trainer.load_model(trained[0])
+
+    # Tasks among `names` that haven't finished yet; failed tasks count as finished
+    def pending(self, names):
+        return [name for name in names if name in self.status and self.status[name]['state'] in ('pending', 'running')]
+
+    def ready(self):
+        return not self.pending(self.status)
+
+# Starts the process-wide warm-up once, however many sessions and reruns ask for it.
+# WARMUP=0 disables it, and every page then builds what it needs on its first visit.
+def start(data_dir='data', model_dir='models'):
+    global _WARMUP
+    with _WARMUP_LOCK:
+        if _WARMUP is None and os.environ.get('WARMUP', '1') != '0':
+            _WARMUP = Warmup(data_dir, model_dir).start(int(os.environ.get('WARMUP_THREADS', 4)))
+        return _WARMUP
+
+def current():
+    return _WARMUP
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the dataset, derived tables and model metrics before the app starts")
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--all', action='store_true', help="Also build the in-memory caches (useful as a smoke test)")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--prune-shared', action='store_true', help="Remove data/shared/ files of older data versions "
+        "(e.g. after ingesting a batch); servers that already mapped them keep their mappings")
+    args = parser.parse_args()
+
+    tasks = None if args.all else {name for name, _, persisted in TASKS if persisted}
+    warmup = Warmup(args.data_dir, args.model_dir, tasks).start(args.workers).wait()
+    for name, status in warmup.status.items():
+        print(f"{name:<15} {status['state']:<8} {status['seconds']:8.1f}s {status['error'] or ''}")
+    if not all(status['state'] == 'ready' for status in warmup.status.values()):
+        raise SystemExit(1)
+    if args.prune_shared:
+        removed = warmup.data_processor.prune_shared()
+        print(f"Removed {len(removed)} shared files of older data versions")
+
+if __name__ == "__main__":
+    main()